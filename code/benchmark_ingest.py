@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import platform
+import subprocess
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+import feeder
+
+# Ingestion benchmark over the bundled SWIS-ISSDC sample files.
+# Each file is first split into the core stages, timed on their own:
+#   decode (CDF -> raw arrays), filter (raw -> column batch),
+#   write (batch -> swis_moments with the bare writer; always rolled back)
+# `write` leaves out everything else process_cdf_file does: the manifest check
+# and record, the delete of a replaced version, chunked streaming, the rollup
+# refresh and the watermark. The `ingest` stage then runs the same file through
+# feeder.process_cdf_file itself (forced, so the manifest never skips it) and
+# is the end-to-end figure used for the totals.
+# Point DB_URI at a local Postgres. Ingests are rolled back unless --commit is given.
+
+STAGES = ('decode', 'filter', 'write', 'ingest')
+
+def current_rss_mb():
+    """
+    Resident set size right now, from /proc/self/statm (Linux; None elsewhere).
+    Unlike ru_maxrss, which is the peak of the whole process so far, this can
+    be sampled before and after each stage.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+@contextmanager
+def measure(stage, metrics):
+    """Records wall time, peak traced allocation and RSS before/after for one stage."""
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        traced_peak = tracemalloc.get_traced_memory()[1] if tracing else None
+        rss_after = current_rss_mb()
+        metrics[stage] = {
+            'seconds': elapsed,
+            'peak_alloc_mb': traced_peak / (1024 * 1024) if tracing else None,
+            'rss_mb': rss_after,
+            'rss_delta_mb': rss_after - rss_before if rss_before is not None and rss_after is not None else None
+        }
+
+def bench_file(conn, filepath, bulk=True, use_cache=False, chunk_size=None, commit=False):
+    metrics = {}
+
+    with measure('decode', metrics):
+        raw = feeder.read_raw_cdf(filepath, use_cache=use_cache)
+        records = len(raw['observation_time'])
+
+    with measure('filter', metrics):
+        batch = feeder.build_batch(raw)
+        rows = feeder.batch_size(batch)
+    del raw
+
+    cursor = conn.cursor()
+    try:
+        with measure('write', metrics):
+            if bulk:
+                feeder.copy_batch(cursor, batch)
+            else:
+                feeder.insert_batch(cursor, batch)
+    finally:
+        conn.rollback()
+        cursor.close()
+    del batch
+
+    try:
+        with measure('ingest', metrics):
+            stats = feeder.process_cdf_file(conn, filepath, bulk=bulk, force=True, use_cache=use_cache,
+                                            chunk_size=chunk_size, commit=False)
+            if commit:
+                conn.commit()
+    finally:
+        if not commit:
+            conn.rollback()
+
+    for m in metrics.values():
+        m['rows_per_sec'] = rows / m['seconds'] if m['seconds'] > 0 else None
+
+    total = metrics['ingest']['seconds']
+    return {
+        'file': os.path.basename(filepath),
+        'records': records,
+        'rows': rows,
+        'added': stats['added'],
+        'seconds': total,
+        'rows_per_sec': rows / total if total > 0 else None,
+        'stages': metrics
+    }
+
+def summarize(files, trace_alloc=True):
+    rows = sum(f['rows'] for f in files)
+    summary = {'files': len(files), 'rows': rows, 'stages': {}}
+    for stage in STAGES:
+        seconds = sum(f['stages'][stage]['seconds'] for f in files)
+        rss = [f['stages'][stage]['rss_mb'] for f in files if f['stages'][stage]['rss_mb'] is not None]
+        growth = [f['stages'][stage]['rss_delta_mb'] for f in files if f['stages'][stage]['rss_delta_mb'] is not None]
+        summary['stages'][stage] = {
+            'seconds': seconds,
+            'rows_per_sec': rows / seconds if seconds > 0 else None,
+            'peak_alloc_mb': max((f['stages'][stage]['peak_alloc_mb'] or 0) for f in files) if trace_alloc else None,
+            'rss_mb': max(rss) if rss else None,
+            'rss_delta_mb': max(growth) if growth else None
+        }
+    summary['seconds'] = summary['stages']['ingest']['seconds']
+    summary['rows_per_sec'] = summary['stages']['ingest']['rows_per_sec']
+    return summary
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def print_summary(summary, baseline=None):
+    print(f"\n{'Stage':<8} | {'Seconds':>9} | {'Rows/s':>12} | {'Peak alloc MB':>13} | {'RSS MB':>8} | {'RSS +MB':>8} | {'vs baseline':>11}")
+    print("-" * 88)
+    for stage in STAGES:
+        s = summary['stages'][stage]
+        rss = f"{s['rss_mb']:.1f}" if s.get('rss_mb') is not None else '-'
+        growth = f"{s['rss_delta_mb']:+.1f}" if s.get('rss_delta_mb') is not None else '-'
+        alloc = f"{s['peak_alloc_mb']:.1f}" if s.get('peak_alloc_mb') is not None else '-'
+        delta = '-'
+        if baseline:
+            b = baseline['stages'].get(stage, {})
+            if b.get('rows_per_sec') and s['rows_per_sec']:
+                delta = f"{s['rows_per_sec'] / b['rows_per_sec']:.2f}x"
+        print(f"{stage:<8} | {s['seconds']:>9.3f} | {s['rows_per_sec'] or 0:>12,.0f} | {alloc:>13} | {rss:>8} | {growth:>8} | {delta:>11}")
+    print(f"\n{summary['files']} files, {summary['rows']} rows. 'write' is the bare writer only (no manifest, "
+          f"chunking, rollup refresh or watermark); 'ingest' is feeder.process_cdf_file end to end.")
+
+def run_benchmark(base_folder=feeder.DATA_DIR, bulk=True, use_cache=False, chunk_size=None, commit=False,
+                  limit=None, trace_alloc=True):
+    """
+    Runs every sample file through decode/filter/write and process_cdf_file, and returns the results dict.
+    tracemalloc slows down allocation-heavy stages; pass trace_alloc=False for pure timings.
+    """
+    filepaths = []
+    for sub in ('positive', 'negative'):
+        folder_path = os.path.join(base_folder, sub)
+        if os.path.exists(folder_path):
+            filepaths.extend(feeder.collect_cdf_files(folder_path, verbose=False))
+    if limit:
+        filepaths = filepaths[:limit]
+
+    conn = feeder.get_db_connection()
+    feeder.ensure_ingest_schema(conn)
+    if trace_alloc:
+        tracemalloc.start()
+    files = []
+    try:
+        for done, path in enumerate(filepaths, start=1):
+            try:
+                result = bench_file(conn, path, bulk=bulk, use_cache=use_cache, chunk_size=chunk_size, commit=commit)
+            except Exception as e:
+                print(f"  [{done}/{len(filepaths)}] {os.path.basename(path)}: Error: {e}")
+                continue
+            files.append(result)
+            print(f"  [{done}/{len(filepaths)}] {result['file']}: {result['rows']} rows in "
+                  f"{result['seconds']:.2f}s ({result['rows_per_sec']:,.0f} rows/s)")
+    finally:
+        if trace_alloc:
+            tracemalloc.stop()
+        conn.close()
+
+    return {
+        'run_at': datetime.now().isoformat(),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'options': {'bulk': bulk, 'use_cache': use_cache, 'chunk_size': chunk_size, 'commit': commit,
+                    'trace_alloc': trace_alloc, 'data_dir': base_folder},
+        'summary': summarize(files, trace_alloc) if files else None,
+        'files': files
+    }
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark the feeder ingestion pipeline on the bundled SWIS CDFs")
+    parser.add_argument("--data-dir", type=str, default=feeder.DATA_DIR, help="Folder with positive/ and negative/ CDF subfolders")
+    parser.add_argument("--insert", action="store_true", help="Use per-row INSERTs instead of the bulk COPY writer")
+    parser.add_argument("--cache", action="store_true", help="Decode through the .npcache columnar cache")
+    parser.add_argument("--chunk-size", type=int, default=None, help="Stream each file in chunks of this many records in the ingest stage")
+    parser.add_argument("--commit", action="store_true", help="Commit each file's ingest stage (default: roll back each file)")
+    parser.add_argument("--no-alloc", action="store_true", help="Skip tracemalloc allocation tracking (pure timings)")
+    parser.add_argument("--limit", type=int, default=None, help="Only benchmark the first N files")
+    parser.add_argument("--output", type=str, default=None, help="JSON results file (default: ingest_benchmark_<timestamp>.json)")
+    parser.add_argument("--compare", type=str, default=None, help="Previous results JSON to compare rows/s against")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.data_dir, bulk=not args.insert, use_cache=args.cache, chunk_size=args.chunk_size,
+                            commit=args.commit, limit=args.limit, trace_alloc=not args.no_alloc)
+    if results['summary'] is None:
+        print("No files benchmarked.")
+        exit(1)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f).get('summary')
+    print_summary(results['summary'], baseline)
+
+    output = args.output or f"ingest_benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output}")
@@ -9,6 +9,9 @@ load_dotenv()
 
 DB_URI = os.getenv('DB_URI')
 
+# Catalogue years fetched by a full scrape
+SCRAPE_YEARS = [2024, 2025, 2026]
+
 def save_to_db(df):
     if df is None or df.empty:
         print(" No data to save.")
@@ -82,15 +85,31 @@ def scrape_cactus(year, month):
             
     return pd.DataFrame(cme_data)
 
+def scrape_range(years, progress=None):
+    """
+    Scrapes and stores every month of the given years.
+    `progress(done, total, label)` is called after each month; an exception
+    raised from it stops the run.
+    """
+    months = [(year, month) for year in years for month in range(1, 13)]
+    saved = 0
+
+    for done, (year, month) in enumerate(months, start=1):
+        print(f"\n--- Scraping CME Data for {year}-{month:02d} ---")
+        df_cme = scrape_cactus(year, month)
+        
+        if df_cme is not None and not df_cme.empty:
+            print(df_cme.head())
+            save_to_db(df_cme)
+            saved += len(df_cme)
+        else:
+            print(f" No CME data found for this {year} - {month:02d}.")
+
+        if progress:
+            progress(done, len(months), f"{year}-{month:02d}")
+
+    print("\nScraping completed.")
+    return saved
+
 if __name__ == "__main__":
-    for year in [2024, 2025, 2026]:
-        for month in range(1, 13):
-            print(f"\n--- Scraping CME Data for {year}-{month:02d} ---")
-            df_cme = scrape_cactus(year, month)
-            
-            if df_cme is not None and not df_cme.empty:
-                print(df_cme.head())
-                save_to_db(df_cme)
-            else:
-                print(f" No CME data found for this {year} - {month:02d}.")
-    print("\nScraping completed.")
\ No newline at end of file
+    scrape_range(SCRAPE_YEARS)
@@ -0,0 +1,176 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+import cdflib
+import numpy as np
+
+# Decoded CDF variables are cached next to the source file:
+#   AL1_..._V02.cdf  ->  AL1_..._V02.npcache/<variable>.npy + meta.json
+# Each .npy can be memory-mapped back, so later reads skip CDF parsing entirely.
+
+CACHE_SUFFIX = '.npcache'
+META_FILE = 'meta.json'
+CACHE_FORMAT = 1
+
+# Product version suffix; the manifest in feeder.py keys products on the name without it
+VERSION_PATTERN = re.compile(r"_V(\d+)\.cdf$", re.IGNORECASE)
+
+def file_sha256(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def split_version(filename):
+    """'..._V02.cdf' -> ('...', 2). Files without a version suffix are version 0."""
+    match = VERSION_PATTERN.search(filename)
+    if not match:
+        return os.path.splitext(filename)[0], 0
+    return filename[:match.start()], int(match.group(1))
+
+def file_version(filepath):
+    """'..._V02.cdf' -> 2. Files without a version suffix are version 0."""
+    return split_version(os.path.basename(filepath))[1]
+
+def cache_path(filepath):
+    return os.path.splitext(filepath)[0] + CACHE_SUFFIX
+
+def _read_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, META_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def is_cache_valid(filepath, meta):
+    """
+    A cache is valid while the source keeps the same version and content.
+    Size + mtime is checked first; the hash is only computed when they differ.
+    """
+    if not meta or meta.get('format') != CACHE_FORMAT:
+        return False
+    if meta.get('version') != file_version(filepath):
+        return False
+
+    stat = os.stat(filepath)
+    if meta.get('size') != stat.st_size:
+        return False
+    if meta.get('mtime') == stat.st_mtime:
+        return True
+
+    # Touched but possibly unchanged (e.g. re-downloaded): compare contents
+    if meta.get('sha256') != file_sha256(filepath):
+        return False
+    meta['mtime'] = stat.st_mtime
+    with open(os.path.join(cache_path(filepath), META_FILE), 'w') as f:
+        json.dump(meta, f, indent=2)
+    return True
+
+def write_cache(filepath, variables=None):
+    """
+    Decodes a CDF file and writes one .npy per variable next to it.
+    By default every record-varying zVariable is cached. Returns the cache directory.
+    """
+    cdf = cdflib.CDF(filepath)
+    if variables is None:
+        variables = cdf.cdf_info().zVariables
+
+    stat = os.stat(filepath)
+    meta = {
+        'format': CACHE_FORMAT,
+        'source': os.path.basename(filepath),
+        'version': file_version(filepath),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'sha256': file_sha256(filepath),
+        'variables': {}
+    }
+
+    # Build in a temp directory and swap it in, so readers never see a half-written cache
+    target = cache_path(filepath)
+    tmp_dir = f"{target}.tmp{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    try:
+        for var in variables:
+            data = np.asarray(cdf.varget(var))
+            np.save(os.path.join(tmp_dir, f"{var}.npy"), data)
+            meta['variables'][var] = {'dtype': data.dtype.str, 'shape': list(data.shape)}
+
+        with open(os.path.join(tmp_dir, META_FILE), 'w') as f:
+            json.dump(meta, f, indent=2)
+
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp_dir, target)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return target
+
+def load_cache(filepath, variables=None, mmap=True):
+    """
+    Returns {variable: array} from a valid cache (memory-mapped by default),
+    or None when the cache is missing, stale, or lacks a requested variable.
+    """
+    cache_dir = cache_path(filepath)
+    meta = _read_meta(cache_dir)
+    if not is_cache_valid(filepath, meta):
+        return None
+
+    if variables is None:
+        variables = list(meta['variables'])
+    if any(var not in meta['variables'] for var in variables):
+        return None
+
+    mmap_mode = 'r' if mmap else None
+    return {var: np.load(os.path.join(cache_dir, f"{var}.npy"), mmap_mode=mmap_mode) for var in variables}
+
+def read_variables(filepath, variables=None, mmap=True):
+    """
+    Reader used by ingestion and analysis: serves variables from the cache,
+    (re)building it from the CDF file first when it is missing or stale.
+    """
+    arrays = load_cache(filepath, variables, mmap=mmap)
+    if arrays is None:
+        write_cache(filepath)
+        arrays = load_cache(filepath, variables, mmap=mmap)
+    if arrays is None:
+        raise ValueError(f"Variables {list(variables)} not found in {os.path.basename(filepath)}")
+    return arrays
+
+def build_caches(folder_path, force=False):
+    """Converts every .cdf file in a folder (recursively) to its columnar cache."""
+    built = 0
+    for root, dirs, files in os.walk(folder_path):
+        dirs[:] = [d for d in dirs if not d.endswith(CACHE_SUFFIX)]
+        for filename in sorted(files):
+            if not filename.endswith('.cdf'):
+                continue
+            path = os.path.join(root, filename)
+
+            if not force and is_cache_valid(path, _read_meta(cache_path(path))):
+                print(f"  Up to date: {filename}")
+                continue
+            try:
+                write_cache(path)
+                built += 1
+                print(f"  Cached: {filename}")
+            except Exception as e:
+                print(f"  Error caching {filename}: {e}")
+    print(f"\n Built {built} cache(s) under {folder_path}")
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Convert SWIS CDF files to memory-mappable .npy caches")
+    parser.add_argument("dir", type=str, help="Directory containing CDF files")
+    parser.add_argument("--force", action="store_true", help="Rebuild caches even if they are up to date")
+    args = parser.parse_args()
+
+    if os.path.exists(args.dir):
+        build_caches(args.dir, force=args.force)
+    else:
+        print(f"Directory not found: {args.dir}")
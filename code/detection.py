@@ -3,6 +3,8 @@ import numpy as np
 import psycopg2
 from psycopg2.extras import execute_values
 import os
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,122 +12,455 @@ load_dotenv()
 # DATABASE CONNECTION
 DB_URI = os.getenv('DB_URI')
 
-def detect_cme_events(start_date, end_date):
-    conn = psycopg2.connect(DB_URI)
-    
-    print(f" Analyzing data from {start_date} to {end_date}...")
-
-    # 1. FETCH RAW DATA
-    # We fetch Alphas and Protons to calculate the ratio
-    query = f"""
-        SELECT record_id, observation_time, 
-               proton_speed, proton_density, 
-               alpha_density
-        FROM swis_moments 
-        WHERE observation_time BETWEEN '{start_date}' AND '{end_date}'
-        AND proton_speed > 0 AND proton_speed < 3000
-        ORDER BY observation_time ASC;
-    """
-    df = pd.read_sql(query, conn)
-    
-    if df.empty:
-        print(" No data found for analysis.")
-        return
+# DETECTION THRESHOLDS
+FAST_SPEED = 450                 # km/s, "fast" wind (needs a shock or driver gas to count)
+STORM_SPEED = 600                # km/s, dangerous on its own (absolute storm)
+SHOCK_SIGMA = 3                  # jump above the rolling mean, in rolling std devs
+ALPHA_RATIO_THRESHOLD = 0.04     # alpha/proton density ratio of CME driver gas
+ROLLING_WINDOW = '6h'
+PARTITION_FREQ = 'MS'            # parallel reprocessing: one partition per calendar month
+COOLDOWN_PERIOD = pd.Timedelta(hours=4)     # quiet time before an event is declared over
+MIN_DURATION = pd.Timedelta(minutes=30)     # shorter events are blips
+HIGH_SEVERITY_SPEED = 800        # km/s peak for a HIGH alert
 
-    # 2. FEATURE ENGINEERING (The Data Science Part)
+def compute_features(df):
+    """Indexes by time and adds alpha_ratio and the rolling speed statistics."""
     # Calculate Rolling Mean & Std Dev (6-hour window)
     # Assuming data is roughly hourly or minute-cadence, we use a time-based window
-    df.set_index('observation_time', inplace=True)
+    df = df.set_index('observation_time')
     
     # Calculate Alpha/Proton Ratio (Handle division by zero)
     df['alpha_ratio'] = df['alpha_density'] / df['proton_density'].replace(0, np.nan)
     
     # Calculate Rolling Statistics for Speed
-    window_size = '6h' 
-    df['rolling_mean_v'] = df['proton_speed'].rolling(window=window_size).mean()
-    df['rolling_std_v'] = df['proton_speed'].rolling(window=window_size).std()
+    df['rolling_mean_v'] = df['proton_speed'].rolling(window=ROLLING_WINDOW).mean()
+    df['rolling_std_v'] = df['proton_speed'].rolling(window=ROLLING_WINDOW).std()
+    return df
 
-    # 3. APPLY DETECTION LOGIC (EVENT GROUPING WITH COOLDOWN)
-    alerts = []
+def danger_mask(df):
+    """Per-row danger flag, evaluated as whole-column operations."""
+    speed = df['proton_speed']
+
+    # 1. High Speed (Storm) - Lowered threshold to catch slower CMEs
+    is_fast = speed > FAST_SPEED
     
-    # State Variables
-    in_event = False
-    event_start_time = None
-    last_danger_time = None
-    max_speed_in_event = 0
+    # 2. Shock (Sudden Jump). A NaN threshold (not enough history) compares False.
+    threshold = df['rolling_mean_v'] + (SHOCK_SIGMA * df['rolling_std_v'])
+    is_shock = speed > threshold
     
-    # Cooldown: How long to wait before declaring an event "over" (e.g., 4 hours)
-    COOLDOWN_PERIOD = pd.Timedelta(hours=4)
+    # 3. Alpha Ratio (Driver Gas)
+    is_enriched = df['alpha_ratio'] > ALPHA_RATIO_THRESHOLD
     
-    for time, row in df.iterrows():
-        
-        # --- CONDITIONS ---
-        # 1. High Speed (Storm) - Lowered threshold to catch slower CMEs
-        is_fast = row['proton_speed'] > 450
-        
-        # 2. Shock (Sudden Jump)
-        threshold = row['rolling_mean_v'] + (3 * row['rolling_std_v'])
-        is_shock = row['proton_speed'] > threshold if not pd.isna(threshold) else False
-        
-        # 3. Alpha Ratio (Driver Gas)
-        is_enriched = row['alpha_ratio'] > 0.04
-        
-        # TRIGGER LOGIC: Is this a dangerous moment?
-        # Relaxed trigger: Speed > 450 AND (Shock OR Enriched) OR Speed > 600 (Absolute Storm)
-        is_danger = (is_fast and is_shock) or (is_fast and is_enriched) or (row['proton_speed'] > 600)
+    # TRIGGER LOGIC: Is this a dangerous moment?
+    # Relaxed trigger: Speed > 450 AND (Shock OR Enriched) OR Speed > 600 (Absolute Storm)
+    return ((is_fast & is_shock) | (is_fast & is_enriched) | (speed > STORM_SPEED)).to_numpy()
 
-        # --- STATE MACHINE WITH COOLDOWN ---
-        
-        if is_danger:
-            # Update the last time we saw danger
-            last_danger_time = time
-            
-            if not in_event:
-                # START of a new event
-                in_event = True
-                event_start_time = time
-                max_speed_in_event = row['proton_speed']
+def segment_events(times, speeds, danger, cooldown=COOLDOWN_PERIOD):
+    """
+    Groups danger rows into events with the cooldown rule, using array reductions.
+
+    An event ends at the first non-danger row that comes more than COOLDOWN_PERIOD
+    after its last danger row; a later danger row opens a new event. Since rows
+    are time ordered, the event breaks after danger row i exactly when the row
+    just before the next danger row (or the final row) is past the cooldown.
+
+    Returns (start_pos, last_pos, peak_speed, close_pos) per event, as positions
+    into the input arrays. close_pos is -1 for an event still open at the end.
+    `cooldown` is overridable for parameter sweeps (see detection_sweep.py).
+    """
+    times = np.asarray(times)
+    danger_pos = np.flatnonzero(danger)
+    if len(danger_pos) == 0:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, np.array([], dtype=np.float64), empty
+
+    cooldown = pd.Timedelta(cooldown).to_timedelta64()
+    danger_times = times[danger_pos]
+
+    # Latest row seen before the next danger row (or the end of the data)
+    latest_before_next = np.append(times[danger_pos[1:] - 1], times[-1])
+    closes = (latest_before_next - danger_times) > cooldown
+
+    # Run boundaries: an event ends at each closing danger row, or at the last one
+    ends = np.flatnonzero(closes)
+    if len(ends) == 0 or ends[-1] != len(danger_pos) - 1:
+        ends = np.append(ends, len(danger_pos) - 1)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+
+    peak_speed = np.maximum.reduceat(np.asarray(speeds, dtype=np.float64)[danger_pos], starts)
+
+    # The row that closed each event: first row strictly later than last danger + cooldown
+    close_pos = np.searchsorted(times, danger_times[ends] + cooldown, side='right')
+    close_pos = np.where(closes[ends], close_pos, -1)
+
+    return danger_pos[starts], danger_pos[ends], peak_speed, close_pos
+
+def find_alerts(df, state=None, danger=None):
+    """
+    Runs the detector over a feature frame (see compute_features), or over
+    rows whose danger flags were already computed (see fetch_danger_rows).
+
+    `state` carries an event left open by a previous run (see load_checkpoint);
+    its last danger sample is replayed as a virtual first row so the cooldown
+    and peak tracking continue exactly where that run stopped.
+    Returns (alerts, state) where the new state describes the end of `df`.
+    """
+    if df.empty:
+        return [], state
+
+    if danger is None:
+        danger = danger_mask(df)
+    times = df.index.values
+    speeds = df['proton_speed'].to_numpy()
+    record_ids = df['record_id'].to_numpy()
+
+    carried = state is not None and state.get('event_start') is not None
+    offset = 0
+    if carried:
+        virtual_time = pd.Timestamp(state['last_danger']).to_datetime64().astype(times.dtype)
+        times = np.concatenate(([virtual_time], times))
+        speeds = np.concatenate(([state['peak_speed']], speeds))
+        danger = np.concatenate(([True], danger))
+        offset = 1
+
+    def time_at(pos, is_start):
+        if pos < offset:
+            return pd.Timestamp(state['event_start'] if is_start else state['last_danger'])
+        return df.index[pos - offset]
+
+    start_pos, last_pos, peak_speed, close_pos = segment_events(times, speeds, danger)
+
+    alerts = []
+    new_state = {'last_time': df.index[-1], 'event_start': None, 'last_danger': None, 'peak_speed': None}
+    for start, last, peak, close in zip(start_pos, last_pos, peak_speed, close_pos):
+        event_start_time = time_at(start, True)
+        last_danger_time = time_at(last, False)
+
+        if close < 0:
+            new_state.update(event_start=event_start_time, last_danger=last_danger_time, peak_speed=float(peak))
+
+        alert = event_alert(event_start_time, last_danger_time, peak,
+                            record_ids[close - offset] if close >= 0 else None)
+        if alert:
+            alerts.append(alert)
+    return alerts, new_state
+
+def event_alert(event_start_time, last_danger_time, peak, close_record_id):
+    """Alert dict for one event, or None for a blip. close_record_id is None while the event is open."""
+    # Calculate duration based on when the danger actually stopped
+    duration = last_danger_time - event_start_time
+    
+    # Filter out tiny blips (e.g., must last at least 30 mins)
+    if duration <= MIN_DURATION:
+        return None
+
+    severity = 'HIGH' if peak > HIGH_SEVERITY_SPEED else 'MEDIUM'
+    if close_record_id is not None:
+        return {
+            'generated_at': event_start_time,
+            'severity': severity,
+            'message': f"CME Event Detected. Duration: {duration}. Peak Speed: {int(peak)} km/s",
+            'swis_record_id': close_record_id # Link to the end record for reference
+        }
+    # Event is still active at the end of the dataset
+    return {
+        'generated_at': event_start_time,
+        'severity': severity,
+        'message': f"CME Event Detected (Ongoing). Duration: {duration}. Peak Speed: {int(peak)} km/s",
+        'swis_record_id': 0 # Placeholder
+    }
+
+def alert_rows(alerts):
+    # Convert numpy types to native Python types for psycopg2
+    return [
+        (
+            x['generated_at'].to_pydatetime() if hasattr(x['generated_at'], 'to_pydatetime') else x['generated_at'], 
+            x['severity'], 
+            x['message'], 
+            int(x['swis_record_id'])
+        ) 
+        for x in alerts
+    ]
+
+MOMENT_COLUMNS = ['record_id', 'observation_time', 'proton_speed', 'proton_density', 'alpha_density']
+
+def moments_query(include_start=True):
+    lower = ">=" if include_start else ">"
+    return f"""
+        SELECT record_id, observation_time, 
+               proton_speed, proton_density, 
+               alpha_density
+        FROM swis_moments 
+        WHERE observation_time {lower} %s AND observation_time <= %s
+        AND proton_speed > 0 AND proton_speed < 3000
+        ORDER BY observation_time ASC, record_id ASC;
+    """
+
+def fetch_moments(conn, start_date, end_date, include_start=True):
+    """Reads the detector's input columns for a time range, oldest first."""
+    return pd.read_sql(moments_query(include_start), conn, params=(start_date, end_date))
+
+def iter_moment_chunks(conn, start_date, end_date, chunk_size, include_start=True):
+    """
+    Same rows as fetch_moments, streamed through a server-side cursor as
+    DataFrames of at most chunk_size rows, so the range is never held in memory.
+    """
+    cursor = conn.cursor(name='cme_detection_stream')
+    cursor.itersize = chunk_size
+    try:
+        cursor.execute(moments_query(include_start), (start_date, end_date))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield pd.DataFrame(rows, columns=MOMENT_COLUMNS)
+    finally:
+        cursor.close()
+
+def find_alerts_chunked(chunks, state=None, after=None):
+    """
+    Runs the detector over time-ordered raw chunks, giving the same alerts as
+    find_alerts on their concatenation.
+
+    The raw rows of the last ROLLING_WINDOW are prepended to the next chunk so
+    its rolling statistics see the same history, and the open event moves on
+    through `state`. An event reported as ongoing in one chunk is replaced by
+    its later report. Rows at or before `after` only seed the rolling window.
+    Returns (alerts, state, row_count).
+    """
+    alerts = {}
+    tail = None
+    row_count = 0
+    window = pd.Timedelta(ROLLING_WINDOW)
+
+    for chunk in chunks:
+        row_count += len(chunk)
+        frame = chunk if tail is None else pd.concat([tail, chunk], ignore_index=True)
+
+        features = compute_features(frame).iloc[len(frame) - len(chunk):]
+        if after is not None:
+            features = features[features.index > after]
+        chunk_alerts, state = find_alerts(features, state=state)
+        for alert in chunk_alerts:
+            alerts[alert['generated_at']] = alert
+
+        times = frame['observation_time']
+        tail = frame[times > times.iloc[-1] - window]
+
+    return list(alerts.values()), state, row_count
+
+# --- DATABASE-SIDE FEATURES ---
+# Postgres computes the ratio, the rolling statistics and the danger flag,
+# and returns only the rows segment_events actually looks at:
+#   * danger rows,
+#   * the row just before each danger row and the final row (cooldown checks),
+#   * the first row past each danger row's cooldown (the row that closes an event).
+# The window is (t - 6h, t] like the pandas rolling window; observation_time
+# is unique, so there are no peer rows to disagree on.
+
+DANGER_ROWS_QUERY = """
+    WITH features AS (
+        SELECT record_id, observation_time, proton_speed,
+               AVG(proton_speed::numeric) OVER w AS rolling_mean_v,
+               STDDEV_SAMP(proton_speed::numeric) OVER w AS rolling_std_v,
+               alpha_density / NULLIF(proton_density, 0) AS alpha_ratio,
+               COUNT(*) OVER () AS total_rows
+        FROM swis_moments
+        WHERE observation_time >= %(start)s AND observation_time <= %(end)s
+        AND proton_speed > 0 AND proton_speed < 3000
+        WINDOW w AS (ORDER BY observation_time
+                     RANGE BETWEEN %(window)s::interval - INTERVAL '1 microsecond' PRECEDING AND CURRENT ROW)
+    ), flagged AS (
+        SELECT record_id, observation_time, proton_speed, total_rows,
+               COALESCE((proton_speed > %(fast)s AND proton_speed > rolling_mean_v + %(sigma)s * rolling_std_v)
+                        OR (proton_speed > %(fast)s AND alpha_ratio > %(alpha_ratio)s)
+                        OR proton_speed > %(storm)s, FALSE) AS danger
+        FROM features
+    ), marked AS (
+        SELECT *,
+               MAX(CASE WHEN danger THEN observation_time END) OVER (ORDER BY observation_time ROWS UNBOUNDED PRECEDING) AS last_danger,
+               LAG(observation_time) OVER o AS prev_time,
+               LEAD(danger) OVER o AS next_danger
+        FROM flagged
+        WINDOW o AS (ORDER BY observation_time)
+    )
+    SELECT record_id, observation_time, proton_speed, danger, total_rows
+    FROM marked
+    WHERE danger
+    OR next_danger IS DISTINCT FROM FALSE
+    OR (observation_time - last_danger > %(cooldown)s AND prev_time - last_danger <= %(cooldown)s)
+    ORDER BY observation_time ASC;
+"""
+
+def fetch_danger_rows(conn, start_date, end_date):
+    """
+    Runs DANGER_ROWS_QUERY for a time range. Returns (rows, total_rows) where
+    rows is indexed by observation_time with a boolean `danger` column.
+    """
+    params = {
+        'start': start_date, 'end': end_date,
+        'window': pd.Timedelta(ROLLING_WINDOW).to_pytimedelta(),
+        'cooldown': COOLDOWN_PERIOD.to_pytimedelta(),
+        'fast': FAST_SPEED, 'storm': STORM_SPEED, 'sigma': SHOCK_SIGMA, 'alpha_ratio': ALPHA_RATIO_THRESHOLD
+    }
+    rows = pd.read_sql(DANGER_ROWS_QUERY, conn, params=params)
+    total_rows = int(rows['total_rows'].iloc[0]) if len(rows) else 0
+    return rows.drop(columns='total_rows').set_index('observation_time'), total_rows
+
+# --- PARALLEL PARTITIONS ---
+# Each partition is analyzed on its own (with ROLLING_WINDOW of leading rows
+# as history) and boiled down to its events plus what is needed to decide
+# whether an event left open by the previous partition continues into it.
+# stitch_partitions then replays those boundaries sequentially.
+
+def partition_bounds(start_date, end_date, freq=PARTITION_FREQ):
+    """Splits [start_date, end_date] at calendar boundaries; each partition covers (lower, upper]."""
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    edges = [start_date] + [t for t in pd.date_range(start_date.normalize(), end_date, freq=freq) if start_date < t < end_date]
+    edges.append(end_date)
+    return list(zip(edges[:-1], edges[1:]))
+
+def summarize_partition(df, lower, include_lower=False):
+    """
+    Detects events in the rows of `df` after `lower` (earlier rows are only
+    history for the rolling statistics), as if no event were open at `lower`.
+    """
+    features = compute_features(df)
+    part = features[features.index >= lower] if include_lower else features[features.index > lower]
+    if part.empty:
+        return {'rows': 0}
+
+    danger = danger_mask(part)
+    times = part.index.values
+    record_ids = part['record_id'].to_numpy()
+    start_pos, last_pos, peak_speed, close_pos = segment_events(times, part['proton_speed'].to_numpy(), danger)
+
+    # Latest row before the first danger row: decides if an open event from the previous partition cools down here
+    danger_pos = np.flatnonzero(danger)
+    if len(danger_pos) == 0:
+        gap_time = part.index[-1]
+    elif danger_pos[0] == 0:
+        gap_time = None
+    else:
+        gap_time = part.index[danger_pos[0] - 1]
+
+    # An open event ended before `lower`, so the row that closes it lies within the first cooldown
+    head = np.searchsorted(times, (pd.Timestamp(lower) + COOLDOWN_PERIOD).to_datetime64(), side='right') + 1
+
+    return {
+        'rows': len(part),
+        'last_time': part.index[-1],
+        'events': [(part.index[start], part.index[last], float(peak), int(record_ids[close]) if close >= 0 else None)
+                   for start, last, peak, close in zip(start_pos, last_pos, peak_speed, close_pos)],
+        'gap_time': gap_time,
+        'head_times': part.index[:head],
+        'head_ids': record_ids[:head]
+    }
+
+def stitch_partitions(summaries):
+    """
+    Joins partition summaries (in time order) into the events of a single
+    sequential run. Returns (alerts, state) like find_alerts.
+    """
+    events = []
+    carried = None  # (start, last danger, peak) of the event open at the partition boundary
+    last_time = None
+
+    for summary in summaries:
+        if not summary['rows']:
+            continue
+        last_time = summary['last_time']
+        part_events = list(summary['events'])
+
+        if carried:
+            start, last, peak = carried
+            gap_time = summary['gap_time']
+            if gap_time is not None and gap_time - last > COOLDOWN_PERIOD:
+                # Cooled down before this partition's first danger row
+                close = summary['head_times'].searchsorted(last + COOLDOWN_PERIOD, side='right')
+                events.append((start, last, peak, int(summary['head_ids'][close])))
+            elif part_events:
+                # Straddles the boundary: continues as this partition's first event
+                _, first_last, first_peak, first_close = part_events[0]
+                part_events[0] = (start, first_last, max(peak, first_peak), first_close)
             else:
-                # CONTINUATION: Update max speed
-                if row['proton_speed'] > max_speed_in_event:
-                    max_speed_in_event = row['proton_speed']
-        
-        elif in_event:
-            # Danger is False, but we are in an event.
-            # Check if enough time has passed since the last danger signal to close it.
-            time_since_last_danger = time - last_danger_time
-            
-            if time_since_last_danger > COOLDOWN_PERIOD:
-                # END of the event (Cooldown expired)
-                in_event = False
-                
-                # Calculate duration based on when the danger actually stopped
-                duration = last_danger_time - event_start_time
-                
-                # Filter out tiny blips (e.g., must last at least 30 mins)
-                if duration.total_seconds() > 1800: 
-                    severity = 'HIGH' if max_speed_in_event > 800 else 'MEDIUM'
-                    
-                    alerts.append({
-                        'generated_at': event_start_time,
-                        'severity': severity,
-                        'message': f"CME Event Detected. Duration: {duration}. Peak Speed: {int(max_speed_in_event)} km/s",
-                        'swis_record_id': row['record_id'] # Link to the end record for reference
-                    })
-
-    # Handle case where event is still active at the end of the dataset
-    if in_event:
-        duration = last_danger_time - event_start_time
-        if duration.total_seconds() > 1800:
-            severity = 'HIGH' if max_speed_in_event > 800 else 'MEDIUM'
-            alerts.append({
-                'generated_at': event_start_time,
-                'severity': severity,
-                'message': f"CME Event Detected (Ongoing). Duration: {duration}. Peak Speed: {int(max_speed_in_event)} km/s",
-                'swis_record_id': 0 # Placeholder
-            })
-
-    print(f"⚡ Analysis Complete. Condensed {len(df)} points into {len(alerts)} Discrete Events.")
+                part_events = [(start, last, peak, None)]
+
+        carried = None
+        if part_events and part_events[-1][3] is None:
+            carried = part_events.pop()[:3]
+        events.extend(part_events)
+
+    if last_time is None:
+        return [], None
+
+    state = {'last_time': last_time, 'event_start': None, 'last_danger': None, 'peak_speed': None}
+    if carried:
+        events.append((*carried, None))
+        state.update(event_start=carried[0], last_danger=carried[1], peak_speed=carried[2])
+
+    alerts = [alert for alert in (event_alert(*event) for event in events) if alert]
+    return alerts, state
+
+def _detect_partition(bounds):
+    lower, upper, first = bounds
+    conn = psycopg2.connect(DB_URI)
+    try:
+        # The first partition starts the run, so it gets no history (same as a sequential run)
+        seed_start = lower if first else lower - pd.Timedelta(ROLLING_WINDOW)
+        df = fetch_moments(conn, seed_start.to_pydatetime(), upper.to_pydatetime(), include_start=first)
+    finally:
+        conn.close()
+    return summarize_partition(df, lower, include_lower=first)
+
+def find_alerts_parallel(start_date, end_date, workers, freq=PARTITION_FREQ):
+    """Runs detection over [start_date, end_date] split into partitions on a process pool."""
+    bounds = [(lower, upper, i == 0) for i, (lower, upper) in enumerate(partition_bounds(start_date, end_date, freq))]
+    print(f" Processing {len(bounds)} partitions on {workers} workers...")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        summaries = list(executor.map(_detect_partition, bounds))
+    alerts, state = stitch_partitions(summaries)
+    return alerts, state, sum(summary['rows'] for summary in summaries)
+
+def detect_cme_events(start_date, end_date, chunk_size=None, workers=1, sql=False):
+    """
+    Detects events in a date range and appends them to alerts. Returns the detector state.
+    With chunk_size the range is streamed in chunks of that many rows (flat memory);
+    with workers > 1 monthly partitions are analyzed in parallel and stitched;
+    with sql the features are computed in Postgres and only danger rows are fetched.
+    """
+    conn = psycopg2.connect(DB_URI)
+    
+    print(f" Analyzing data from {start_date} to {end_date}...")
+
+    if sql:
+        rows, row_count = fetch_danger_rows(conn, start_date, end_date)
+        alerts, state = find_alerts(rows, danger=rows['danger'].to_numpy(dtype=bool))
+        print(f" Fetched {len(rows)} of {row_count} rows from the database.")
+    elif workers > 1:
+        alerts, state, row_count = find_alerts_parallel(start_date, end_date, workers)
+    elif chunk_size:
+        alerts, state, row_count = find_alerts_chunked(iter_moment_chunks(conn, start_date, end_date, chunk_size))
+        conn.commit()  # closes the read transaction of the named cursor
+    else:
+        # 1. FETCH RAW DATA
+        # We fetch Alphas and Protons to calculate the ratio
+        df = fetch_moments(conn, start_date, end_date)
+        row_count = len(df)
+
+        if not df.empty:
+            # 2. FEATURE ENGINEERING (The Data Science Part)
+            df = compute_features(df)
+
+            # 3. APPLY DETECTION LOGIC (EVENT GROUPING WITH COOLDOWN)
+            alerts, state = find_alerts(df)
+    
+    if row_count == 0:
+        print(" No data found for analysis.")
+        conn.close()
+        return None
+
+    print(f"⚡ Analysis Complete. Condensed {row_count} points into {len(alerts)} Discrete Events.")
 
     # 4. SAVE ALERTS TO DATABASE (The DBMS Part)
     if alerts:
@@ -136,46 +471,256 @@ def detect_cme_events(start_date, end_date):
             INSERT INTO alerts (generated_at, severity, message, swis_record_id)
             VALUES %s
         """
-        # Convert numpy types to native Python types for psycopg2
-        data_tuples = [
-            (
-                x['generated_at'].to_pydatetime() if hasattr(x['generated_at'], 'to_pydatetime') else x['generated_at'], 
-                x['severity'], 
-                x['message'], 
-                int(x['swis_record_id'])
-            ) 
-            for x in alerts
-        ]
-        
-        execute_values(cursor, insert_query, data_tuples)
+        execute_values(cursor, insert_query, alert_rows(alerts))
         conn.commit()
         print(" Alerts saved to database.")
     else:
         print(" No threats detected (Quiet Sun).")
 
     conn.close()
+    return state
+
+# --- DETECTION CHECKPOINT ---
+# Where the last run stopped and the event it left open, so the next run only
+# has to read new rows (plus the trailing ROLLING_WINDOW of samples, which are
+# re-read from swis_moments to seed the rolling statistics).
+
+CHECKPOINT_NAME = 'cme_detector'
+
+# Held for a whole run, so the upload job and `feeder.py --watch --detect`
+# never read the same checkpoint and replay the same open event twice.
+DETECTION_LOCK_ID = 7201101
+
+@contextmanager
+def detection_lock():
+    """Session-level advisory lock on its own connection; waits for a running detection."""
+    conn = psycopg2.connect(DB_URI)
+    try:
+        conn.autocommit = True
+        conn.cursor().execute("SELECT pg_advisory_lock(%s);", (DETECTION_LOCK_ID,))
+        yield
+    finally:
+        # Closing the session releases the lock
+        conn.close()
+
+def ensure_checkpoint_table(conn):
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS detection_checkpoint (
+            detector VARCHAR(50) PRIMARY KEY,
+            last_processed_time TIMESTAMP,
+            event_start_time TIMESTAMP,
+            last_danger_time TIMESTAMP,
+            peak_speed DOUBLE PRECISION,
+            updated_at TIMESTAMPTZ DEFAULT NOW()
+        );
+    """)
+    # swis_moments revision (ingest_watermark) read before the run's data
+    cursor.execute("ALTER TABLE detection_checkpoint ADD COLUMN IF NOT EXISTS data_revision BIGINT;")
+    conn.commit()
+    cursor.close()
+
+def ensure_alert_key(conn):
+    """
+    Makes generated_at (the event start) unique in alerts, which upsert_alerts
+    relies on. Duplicates left by earlier concurrent runs are dropped first,
+    keeping the newest row of each event.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT to_regclass('alerts_generated_at_key')")
+    if cursor.fetchone()[0] is None:
+        cursor.execute("""
+            DELETE FROM alerts a USING alerts b
+            WHERE a.generated_at = b.generated_at AND a.alert_id < b.alert_id;
+        """)
+        if cursor.rowcount:
+            print(f" Removed {cursor.rowcount} duplicate alerts.")
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS alerts_generated_at_key ON alerts (generated_at);")
+    conn.commit()
+    cursor.close()
+
+def load_checkpoint(cursor):
+    cursor.execute("""
+        SELECT last_processed_time, event_start_time, last_danger_time, peak_speed, data_revision
+        FROM detection_checkpoint
+        WHERE detector = %s
+    """, (CHECKPOINT_NAME,))
+    row = cursor.fetchone()
+    if row is None or row[0] is None:
+        return None
+    return {
+        'last_time': pd.Timestamp(row[0]),
+        'event_start': pd.Timestamp(row[1]) if row[1] else None,
+        'last_danger': pd.Timestamp(row[2]) if row[2] else None,
+        'peak_speed': row[3],
+        'data_revision': row[4]
+    }
+
+def current_data_revision(cursor):
+    """
+    The swis_moments revision in ingest_watermark, or None before the feeder
+    created it. Read it before reading data: every load with a revision up to
+    this one has committed and is visible to the run.
+    """
+    cursor.execute("SELECT to_regclass('ingest_watermark')")
+    if cursor.fetchone()[0] is None:
+        return None
+    cursor.execute("SELECT revision FROM ingest_watermark WHERE source = 'swis_moments'")
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def save_checkpoint(cursor, state, data_revision):
+    def py(ts):
+        return ts.to_pydatetime() if ts is not None else None
+
+    cursor.execute("""
+        INSERT INTO detection_checkpoint
+        (detector, last_processed_time, event_start_time, last_danger_time, peak_speed, data_revision, updated_at)
+        VALUES (%s, %s, %s, %s, %s, %s, NOW())
+        ON CONFLICT (detector) DO UPDATE SET
+            last_processed_time = EXCLUDED.last_processed_time,
+            event_start_time = EXCLUDED.event_start_time,
+            last_danger_time = EXCLUDED.last_danger_time,
+            peak_speed = EXCLUDED.peak_speed,
+            data_revision = EXCLUDED.data_revision,
+            updated_at = EXCLUDED.updated_at;
+    """, (CHECKPOINT_NAME, py(state['last_time']), py(state['event_start']), py(state['last_danger']),
+          state['peak_speed'], data_revision))
+
+def upsert_alerts(cursor, alerts):
+    """
+    Writes alerts keyed by event start time: an event reported as ongoing by an
+    earlier run is updated in place once it grows or closes.
+    """
+    if not alerts:
+        return
+    execute_values(cursor, """
+        INSERT INTO alerts (generated_at, severity, message, swis_record_id)
+        VALUES %s
+        ON CONFLICT (generated_at) DO UPDATE SET
+            severity = EXCLUDED.severity,
+            message = EXCLUDED.message,
+            swis_record_id = EXCLUDED.swis_record_id;
+    """, alert_rows(alerts))
+
+def needs_rescan(cursor, checkpoint):
+    """
+    True when files loaded since the last run wrote data at or before the
+    checkpoint (backfill or a V02 replacing a V01), which an incremental run
+    would never look at. "Since" compares swis_moments revisions rather than
+    timestamps: NOW() is the transaction start, so a load that began before
+    the last run but committed after it would look older than the run.
+    """
+    cursor.execute("SELECT to_regclass('ingest_manifest')")
+    if cursor.fetchone()[0] is None:
+        return False
+    if checkpoint['data_revision'] is None:
+        # Checkpoint saved before revisions were recorded
+        return True
+    cursor.execute("""
+        SELECT MIN(start_time) FROM ingest_manifest
+        WHERE revision > %s
+    """, (checkpoint['data_revision'],))
+    earliest = cursor.fetchone()[0]
+    return earliest is not None and pd.Timestamp(earliest) <= checkpoint['last_time']
 
 # --- RUN ANALYSIS ---
-def run_full_analysis():
+def run_full_analysis(chunk_size=None, workers=1, sql=False):
+    with detection_lock():
+        _run_full_analysis(chunk_size, workers, sql)
+
+def _run_full_analysis(chunk_size=None, workers=1, sql=False):
     conn = psycopg2.connect(DB_URI)
+    ensure_checkpoint_table(conn)
+    ensure_alert_key(conn)
     cursor = conn.cursor()
     
     # 1. Clear existing alerts to prevent duplicates
     print("Clearing old alerts...")
     cursor.execute("TRUNCATE TABLE alerts RESTART IDENTITY CASCADE;")
+    cursor.execute("DELETE FROM detection_checkpoint WHERE detector = %s", (CHECKPOINT_NAME,))
     conn.commit()
     
     # 2. Find the full data range
     print("Detecting data range...")
+    data_revision = current_data_revision(cursor)
     cursor.execute("SELECT MIN(observation_time), MAX(observation_time) FROM swis_moments")
     min_date, max_date = cursor.fetchone()
-    conn.close()
     
     if min_date and max_date:
         print(f"Running detection from {min_date} to {max_date}")
-        detect_cme_events(str(min_date), str(max_date))
+        state = detect_cme_events(min_date, max_date, chunk_size=chunk_size, workers=workers, sql=sql)
+        if state:
+            save_checkpoint(cursor, state, data_revision)
+            conn.commit()
     else:
         print("No data in swis_moments to analyze.")
+    conn.close()
+
+def run_incremental_analysis(chunk_size=None):
+    """
+    Processes only rows newer than the checkpoint and upserts the alerts of
+    events that closed or are still ongoing. Falls back to a full analysis
+    when there is no checkpoint yet or older data changed since the last run.
+    Runs one at a time (see detection_lock).
+    """
+    with detection_lock():
+        _run_incremental_analysis(chunk_size)
+
+def _run_incremental_analysis(chunk_size=None):
+    conn = psycopg2.connect(DB_URI)
+    ensure_checkpoint_table(conn)
+    ensure_alert_key(conn)
+    cursor = conn.cursor()
+
+    checkpoint = load_checkpoint(cursor)
+    if checkpoint is None:
+        conn.close()
+        print("No detection checkpoint yet, running full analysis.")
+        return _run_full_analysis(chunk_size)
+    if needs_rescan(cursor, checkpoint):
+        conn.close()
+        print("Data before the checkpoint changed since the last run, running full analysis.")
+        return _run_full_analysis(chunk_size)
+
+    data_revision = current_data_revision(cursor)
+    cursor.execute("SELECT MAX(observation_time) FROM swis_moments")
+    max_date = cursor.fetchone()[0]
+    if max_date is None or pd.Timestamp(max_date) <= checkpoint['last_time']:
+        print(f"No new data since {checkpoint['last_time']}.")
+        conn.close()
+        return
+
+    # Re-read the trailing window so rolling statistics of new rows see the same history
+    seed_start = checkpoint['last_time'] - pd.Timedelta(ROLLING_WINDOW)
+    print(f" Analyzing data from {checkpoint['last_time']} to {max_date}...")
+    if chunk_size:
+        chunks = iter_moment_chunks(conn, seed_start.to_pydatetime(), max_date, chunk_size, include_start=False)
+    else:
+        chunks = [fetch_moments(conn, seed_start.to_pydatetime(), max_date, include_start=False)]
+    alerts, state, row_count = find_alerts_chunked(chunks, state=checkpoint, after=checkpoint['last_time'])
+
+    upsert_alerts(cursor, alerts)
+    save_checkpoint(cursor, state, data_revision)
+    conn.commit()
+    conn.close()
+    print(f"⚡ Incremental analysis complete. {row_count} points read, {len(alerts)} events upserted.")
 
 if __name__ == "__main__":
-    run_full_analysis()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--full", action="store_true", help="Clear alerts and re-run detection over all of swis_moments")
+    parser.add_argument("--chunk-size", type=int, default=None, help="Stream swis_moments in chunks of this many rows to bound memory")
+    parser.add_argument("--workers", type=int, default=1, help="With --full: analyze monthly partitions on this many processes")
+    parser.add_argument("--sql", action="store_true", help="With --full: compute features in Postgres and fetch only the rows the event logic needs")
+    parser.add_argument("--validate", action="store_true", help="Score the alerts against cme_events after the run")
+    args = parser.parse_args()
+
+    if args.full:
+        run_full_analysis(chunk_size=args.chunk_size, workers=args.workers, sql=args.sql)
+    else:
+        run_incremental_analysis(chunk_size=args.chunk_size)
+
+    if args.validate:
+        import validation
+        validation.print_report(validation.validate())
@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import psycopg2
+import detection
+import validation
+
+# Threshold sweep for the CME detector.
+# The data is read and featurized once (the 6h rolling statistics do not depend
+# on any swept threshold); every combination in the grid is then evaluated on
+# the same arrays and scored against the CACTus catalogue in cme_events
+# (see validation.py for the matching rule).
+#
+# The grid is split by the parameters that change the per-row danger flag
+# (fast, storm, sigma, alpha ratio). Each of those groups builds its mask from
+# precomputed boolean columns, segments it once per cooldown, and scores every
+# minimum duration / HIGH threshold from the same events.
+
+SWEEP_GRID = {
+    'fast_speed': [400, 425, 450, 475, 500],
+    'storm_speed': [550, 600, 650, 700],
+    'shock_sigma': [2, 2.5, 3, 3.5, 4],
+    'alpha_ratio': [0.03, 0.04, 0.05, 0.06],
+    'cooldown_hours': [2, 3, 4, 6],
+    'min_duration_minutes': [15, 30, 60, 120],
+    'high_severity_speed': [700, 800, 900]
+}
+
+# --- DATA ---
+def load_features(conn, start_date, end_date):
+    """Reads and featurizes the range once. Returns plain arrays for the workers."""
+    df = detection.compute_features(detection.fetch_moments(conn, start_date, end_date))
+    return {
+        'times': df.index.values.astype('datetime64[ns]'),
+        'speed': df['proton_speed'].to_numpy(dtype=np.float64),
+        'rolling_mean_v': df['rolling_mean_v'].to_numpy(dtype=np.float64),
+        'rolling_std_v': df['rolling_std_v'].to_numpy(dtype=np.float64),
+        'alpha_ratio': df['alpha_ratio'].to_numpy(dtype=np.float64)
+    }
+
+# --- SWEEP ---
+_features = None
+_truth = None
+_grid = None
+_columns = None
+
+def _init_worker(features, truth, grid):
+    """Builds the boolean building blocks of every danger mask in the grid."""
+    global _features, _truth, _grid, _columns
+    _features, _truth, _grid = features, truth, grid
+
+    speed = features['speed']
+    _columns = {
+        'fast': {v: speed > v for v in grid['fast_speed']},
+        'storm': {v: speed > v for v in grid['storm_speed']},
+        # Same expression as detection.danger_mask; a NaN threshold compares False
+        'shock': {v: speed > features['rolling_mean_v'] + (v * features['rolling_std_v']) for v in grid['shock_sigma']},
+        'enriched': {v: features['alpha_ratio'] > v for v in grid['alpha_ratio']}
+    }
+
+def _evaluate_group(danger_params):
+    fast, storm, sigma, alpha = danger_params
+    danger = (_columns['fast'][fast] & (_columns['shock'][sigma] | _columns['enriched'][alpha])) | _columns['storm'][storm]
+
+    times = _features['times']
+    results = []
+    for cooldown_hours in _grid['cooldown_hours']:
+        start_pos, last_pos, peak_speed, _ = detection.segment_events(
+            times, _features['speed'], danger, cooldown=pd.Timedelta(hours=cooldown_hours))
+        starts = times[start_pos]
+        durations = times[last_pos] - starts
+
+        for min_minutes in _grid['min_duration_minutes']:
+            keep = durations > pd.Timedelta(minutes=min_minutes).to_timedelta64()
+            event_starts = starts[keep]
+            detected, explained = validation.score_events(event_starts, _truth)
+
+            events = len(event_starts)
+            pod = detected / len(_truth) if len(_truth) else None
+            precision = explained / events if events else None
+            f1 = 2 * pod * precision / (pod + precision) if pod and precision else 0.0
+
+            for high in _grid['high_severity_speed']:
+                results.append({
+                    'fast_speed': fast, 'storm_speed': storm, 'shock_sigma': sigma, 'alpha_ratio': alpha,
+                    'cooldown_hours': cooldown_hours, 'min_duration_minutes': min_minutes,
+                    'high_severity_speed': high,
+                    'alerts': events,
+                    'high_alerts': int((peak_speed[keep] > high).sum()),
+                    'cmes': len(_truth),
+                    'cmes_detected': detected,
+                    'false_alarms': events - explained,
+                    'pod': pod,
+                    'precision': precision,
+                    'f1': f1
+                })
+    return results
+
+def run_sweep(features, truth, grid=SWEEP_GRID, workers=1):
+    """Evaluates every combination in the grid. Returns a DataFrame sorted by F1."""
+    groups = list(itertools.product(grid['fast_speed'], grid['storm_speed'], grid['shock_sigma'], grid['alpha_ratio']))
+    total = len(groups) * len(grid['cooldown_hours']) * len(grid['min_duration_minutes']) * len(grid['high_severity_speed'])
+    print(f" Evaluating {total} combinations ({len(groups)} danger masks) on {workers} worker(s)...")
+
+    results = []
+    start = time.perf_counter()
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(features, truth, grid)) as executor:
+            for group_results in executor.map(_evaluate_group, groups, chunksize=max(1, len(groups) // (workers * 4))):
+                results.extend(group_results)
+    else:
+        _init_worker(features, truth, grid)
+        for group in groups:
+            results.extend(_evaluate_group(group))
+
+    elapsed = time.perf_counter() - start
+    print(f" Done in {elapsed:.1f}s ({total / elapsed:,.0f} combinations/s).")
+    return pd.DataFrame(results).sort_values(['f1', 'pod'], ascending=False, ignore_index=True)
+
+def main(start_date=None, end_date=None, grid=SWEEP_GRID, workers=1, halo_only=True, output=None, top=10):
+    conn = psycopg2.connect(detection.DB_URI)
+    try:
+        if not (start_date and end_date):
+            cursor = conn.cursor()
+            cursor.execute("SELECT MIN(observation_time), MAX(observation_time) FROM swis_moments")
+            min_date, max_date = cursor.fetchone()
+            start_date, end_date = start_date or min_date, end_date or max_date
+        if start_date is None:
+            print("No data in swis_moments to analyze.")
+            return None
+
+        print(f" Loading data from {start_date} to {end_date}...")
+        features = load_features(conn, start_date, end_date)
+        truth = validation.load_cmes(conn, start_date, end_date, halo_only=halo_only)
+    finally:
+        conn.close()
+    print(f" {len(features['times'])} points, {len(truth)} {'halo ' if halo_only else ''}CMEs as ground truth.")
+
+    results = run_sweep(features, truth, grid, workers)
+
+    print(f"\nTop {top} settings by F1:")
+    print(results.head(top).to_string(index=False))
+
+    output = output or f"sweep_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    results.to_csv(output, index=False)
+    print(f"\nAll {len(results)} results saved to {output}")
+    return results
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Sweep the CME detector thresholds and score them against cme_events")
+    parser.add_argument("--start", type=str, default=None, help="Start of the analyzed range (default: first observation)")
+    parser.add_argument("--end", type=str, default=None, help="End of the analyzed range (default: last observation)")
+    parser.add_argument("--grid", type=str, default=None, help="JSON file overriding lists in SWEEP_GRID")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes evaluating the grid")
+    parser.add_argument("--all-cmes", action="store_true", help="Score against every CACTus CME, not only halo CMEs")
+    parser.add_argument("--output", type=str, default=None, help="CSV results file (default: sweep_results_<timestamp>.csv)")
+    parser.add_argument("--top", type=int, default=10, help="Number of best settings to print")
+    args = parser.parse_args()
+
+    grid = dict(SWEEP_GRID)
+    if args.grid:
+        with open(args.grid) as f:
+            grid.update(json.load(f))
+
+    main(args.start, args.end, grid=grid, workers=args.workers, halo_only=not args.all_cmes,
+         output=args.output, top=args.top)
@@ -1,21 +1,30 @@
 import os
+import io
+import json
+import time
+import atexit
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import cdflib
 import psycopg2
-from datetime import datetime
 import numpy as np
+from cdf_cache import file_sha256, read_variables, split_version
+import rollups
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DB_URI = os.getenv('DB_URI')
 
-try:
-    conn = psycopg2.connect(DB_URI)
-    cursor = conn.cursor()
-    print("Connected to PostgreSQL successfully.")
-    
+# Default location of the bundled SWIS-ISSDC sample files (<repo>/data/SWIS-ISSDC)
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'SWIS-ISSDC')
+
+def get_db_connection():
+    return psycopg2.connect(DB_URI)
+
+def ensure_unique_constraint(conn):
     # ENSURE UNIQUE CONSTRAINT EXISTS
     # This prevents duplicates and allows us to use "ON CONFLICT DO NOTHING"
+    cursor = conn.cursor()
     try:
         cursor.execute("""
             ALTER TABLE swis_moments 
@@ -34,88 +43,687 @@ try:
         # If duplicate keys exist, we can't create the constraint.
         print(f"Notice: Could not add unique constraint. Reason: {e}")
         conn.rollback()
-        
-except Exception as e:
-    print(f"Database connection failed: {e}")
-    exit()
+    finally:
+        cursor.close()
+
+# Column order shared by the row-by-row INSERT and the bulk COPY path
+MOMENT_COLUMNS = (
+    "observation_time", "proton_density", "proton_speed", "proton_thermal_speed",
+    "alpha_density", "alpha_speed", "alpha_thermal_speed", "sc_x", "sc_y", "sc_z"
+)
+
+# swis_moments column -> SWIS L2 CDF variable name
+CDF_VARIABLES = {
+    "observation_time": "epoch_for_cdf_mod",
+    "proton_density": "proton_density",
+    "proton_speed": "proton_bulk_speed",
+    "proton_thermal_speed": "proton_thermal",
+    "alpha_density": "alpha_density",
+    "alpha_speed": "alpha_bulk_speed",
+    "alpha_thermal_speed": "alpha_thermal",
+    "sc_x": "spacecraft_xpos",
+    "sc_y": "spacecraft_ypos",
+    "sc_z": "spacecraft_zpos",
+}
+
+# Valid proton speed range (km/s). Fill values (-1.0E31) and NaNs fall outside it.
+MIN_SPEED = 0
+MAX_SPEED = 2000
+
+# CDF_EPOCH counts milliseconds since 0000-01-01; this is 1970-01-01 on that scale
+CDF_EPOCH_UNIX_OFFSET_MS = 62167219200000.0
+
+def epoch_to_datetime64(epochs):
+    """Converts an array of CDF epochs to datetime64[us] as one array operation."""
+    epochs = np.asarray(epochs)
+    if epochs.dtype == np.float64:
+        # CDF_EPOCH: plain arithmetic instead of cdflib's per-value conversion
+        micros = np.round((epochs - CDF_EPOCH_UNIX_OFFSET_MS) * 1000.0)
+        return micros.astype(np.int64).astype("datetime64[us]")
+
+    # CDF_TIME_TT2000 / CDF_EPOCH16 need leap-second handling, leave those to cdflib.
+    # Older cdflib versions return integer nanoseconds instead of datetime64, astype() covers both.
+    timestamps = cdflib.cdfepoch.to_datetime(epochs)
+    return np.asarray(timestamps).astype("datetime64[ns]").astype("datetime64[us]")
+
+def build_batch(raw):
+    """
+    Turns raw CDF arrays (keyed by swis_moments column) into a column batch:
+    rows with fill/out-of-range speed are masked out, epochs become
+    datetime64[us] and every measurement column becomes float64.
+    """
+    speed = np.asarray(raw["proton_speed"], dtype=np.float64)
+    valid = (speed >= MIN_SPEED) & (speed <= MAX_SPEED)
+
+    batch = {"observation_time": epoch_to_datetime64(np.asarray(raw["observation_time"])[valid])}
+
+    for column in MOMENT_COLUMNS[1:]:
+        batch[column] = np.asarray(raw[column], dtype=np.float64)[valid]
+    return batch
+
+def read_raw_cdf(filepath, use_cache=False):
+    """
+    Reads the unfiltered SWIS variables of a CDF file, keyed by swis_moments column.
+    With use_cache the variables come from (and populate) the memory-mapped
+    .npcache next to the file instead of being parsed from the CDF.
+    """
+    if use_cache:
+        arrays = read_variables(filepath, list(CDF_VARIABLES.values()))
+        return {column: arrays[var] for column, var in CDF_VARIABLES.items()}
+
+    cdf = cdflib.CDF(filepath)
+    return {column: cdf.varget(var) for column, var in CDF_VARIABLES.items()}
+
+def decode_cdf(filepath, use_cache=False):
+    """Reads a SWIS L2 CDF file and returns its filtered column batch."""
+    return build_batch(read_raw_cdf(filepath, use_cache=use_cache))
+
+def iter_cdf_batches(filepath, chunk_size=None, use_cache=False):
+    """
+    Yields the filtered column batches of a CDF file, `chunk_size` records at a
+    time, so peak memory is bounded by the chunk and not by the file. Without a
+    chunk size the whole file is yielded as a single batch.
+    """
+    if not chunk_size:
+        yield decode_cdf(filepath, use_cache=use_cache)
+        return
+
+    if use_cache:
+        # Slicing the memory-mapped arrays only pages in the records of each chunk
+        arrays = read_variables(filepath, list(CDF_VARIABLES.values()))
+        n_records = len(arrays[CDF_VARIABLES["observation_time"]])
+        for first in range(0, n_records, chunk_size):
+            last = min(first + chunk_size, n_records)
+            yield build_batch({column: arrays[var][first:last] for column, var in CDF_VARIABLES.items()})
+        return
+
+    cdf = cdflib.CDF(filepath)
+    n_records = cdf.varinq(CDF_VARIABLES["observation_time"]).Last_Rec + 1
+    for first in range(0, n_records, chunk_size):
+        # cdflib's record range is inclusive on both ends
+        last = min(first + chunk_size, n_records) - 1
+        yield build_batch({column: cdf.varget(var, startrec=first, endrec=last)
+                           for column, var in CDF_VARIABLES.items()})
+
+def batch_size(batch):
+    return len(batch["observation_time"])
+
+def insert_batch(cursor, batch):
+    """Inserts a column batch one statement at a time (one round trip per record)."""
+    sql = f"""
+        INSERT INTO swis_moments 
+        ({", ".join(MOMENT_COLUMNS)})
+        VALUES ({", ".join(["%s"] * len(MOMENT_COLUMNS))})
+        ON CONFLICT DO NOTHING;
+    """
+    # tolist() hands back native datetime/float objects that psycopg2 can adapt
+    for data in zip(*(batch[column].tolist() for column in MOMENT_COLUMNS)):
+        cursor.execute(sql, data)
+    return batch_size(batch)
+
+def copy_batch(cursor, batch):
+    """
+    Streams a column batch into a temp staging table with a single COPY, then
+    merges it into swis_moments with one set-based INSERT that keeps the
+    unique_observation_time / ON CONFLICT DO NOTHING behaviour.
+    Returns the number of rows actually added to swis_moments.
+    """
+    columns = ", ".join(MOMENT_COLUMNS)
+
+    # Staging table mirrors the column types of swis_moments and is emptied on every commit
+    cursor.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS swis_moments_staging
+        ON COMMIT DELETE ROWS
+        AS SELECT {columns} FROM swis_moments WITH NO DATA;
+    """)
+
+    # Tab-separated text format (COPY default). Each column is formatted as a whole
+    # array; float text such as nan/inf is accepted by Postgres as-is.
+    fields = [np.datetime_as_string(batch["observation_time"], unit="us")]
+    fields += [batch[column].astype(str) for column in MOMENT_COLUMNS[1:]]
+
+    buffer = io.StringIO()
+    buffer.writelines("\t".join(row) + "\n" for row in zip(*fields))
+    buffer.seek(0)
+
+    cursor.copy_expert(f"COPY swis_moments_staging ({columns}) FROM STDIN", buffer)
+    cursor.execute(f"""
+        INSERT INTO swis_moments ({columns})
+        SELECT {columns} FROM swis_moments_staging
+        ON CONFLICT DO NOTHING;
+    """)
+    records_added = cursor.rowcount
+
+    # Several chunks of one file share a transaction, so clear staging for the next one
+    cursor.execute("TRUNCATE swis_moments_staging;")
+    return records_added
+
+# --- INGESTION MANIFEST ---
+# One row per product (file name without its _Vnn suffix) recording which version
+# was loaded, its fingerprint, and the time span it wrote to swis_moments.
+
+def ensure_manifest_table(conn):
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_manifest (
+            product_id VARCHAR(255) PRIMARY KEY,
+            filename VARCHAR(255) NOT NULL,
+            version INT NOT NULL,
+            file_size BIGINT NOT NULL,
+            file_mtime DOUBLE PRECISION,
+            content_hash CHAR(64) NOT NULL,
+            row_count INT,
+            start_time TIMESTAMP,
+            end_time TIMESTAMP,
+            ingested_at TIMESTAMPTZ DEFAULT NOW()
+        );
+    """)
+    # swis_moments revision of the load (see advance_watermark); detection
+    # compares it with its checkpoint to find backfills it has not seen
+    cursor.execute("ALTER TABLE ingest_manifest ADD COLUMN IF NOT EXISTS revision BIGINT;")
+    conn.commit()
+    cursor.close()
+
+def check_manifest(cursor, filepath, force=False):
+    """
+    Compares a file against the manifest without opening it as a CDF.
+    Returns (action, fingerprint, previous) where action is one of:
+      'unchanged'  - same version, size and content already loaded (skip)
+      'superseded' - a newer version of this product is already loaded (skip)
+      'new'        - product never loaded
+      'replace'    - changed file or newer version; `previous` holds the old entry
+    """
+    filename = os.path.basename(filepath)
+    product_id, version = split_version(filename)
+    stat = os.stat(filepath)
+    fingerprint = {
+        'product_id': product_id,
+        'filename': filename,
+        'version': version,
+        'file_size': stat.st_size,
+        'file_mtime': stat.st_mtime,
+        'content_hash': None
+    }
+
+    cursor.execute("""
+        SELECT filename, version, file_size, file_mtime, content_hash, start_time, end_time
+        FROM ingest_manifest
+        WHERE product_id = %s
+    """, (product_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return 'new', fingerprint, None
+
+    previous = dict(zip(('filename', 'version', 'file_size', 'file_mtime', 'content_hash', 'start_time', 'end_time'), row))
+    if force:
+        return 'replace', fingerprint, previous
+
+    if previous['version'] > version:
+        return 'superseded', fingerprint, previous
+
+    if previous['version'] == version and previous['file_size'] == stat.st_size:
+        # Size and mtime match: trust it without reading the file at all
+        if previous['file_mtime'] == stat.st_mtime:
+            return 'unchanged', fingerprint, previous
+
+        # Touched but maybe not modified (e.g. re-downloaded): compare contents
+        fingerprint['content_hash'] = file_sha256(filepath)
+        if fingerprint['content_hash'] == previous['content_hash'].strip():
+            cursor.execute("UPDATE ingest_manifest SET file_mtime = %s WHERE product_id = %s",
+                           (stat.st_mtime, product_id))
+            return 'unchanged', fingerprint, previous
+
+    return 'replace', fingerprint, previous
+
+def record_manifest(cursor, fingerprint, row_count, start_time, end_time, filepath, revision=None):
+    content_hash = fingerprint['content_hash'] or file_sha256(filepath)
+
+    cursor.execute("""
+        INSERT INTO ingest_manifest
+        (product_id, filename, version, file_size, file_mtime, content_hash, row_count, start_time, end_time,
+         revision, ingested_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
+        ON CONFLICT (product_id) DO UPDATE SET
+            filename = EXCLUDED.filename,
+            version = EXCLUDED.version,
+            file_size = EXCLUDED.file_size,
+            file_mtime = EXCLUDED.file_mtime,
+            content_hash = EXCLUDED.content_hash,
+            row_count = EXCLUDED.row_count,
+            start_time = EXCLUDED.start_time,
+            end_time = EXCLUDED.end_time,
+            revision = EXCLUDED.revision,
+            ingested_at = EXCLUDED.ingested_at;
+    """, (fingerprint['product_id'], fingerprint['filename'], fingerprint['version'],
+          fingerprint['file_size'], fingerprint['file_mtime'], content_hash,
+          row_count, start_time, end_time, revision))
+
+# --- INGESTION WATERMARK ---
+# Latest observation_time loaded into swis_moments plus a revision counter that
+# moves on every load, so downstream consumers can tell when new data arrived.
+
+WATERMARK_SOURCE = 'swis_moments'
+NOTIFY_CHANNEL = 'swis_moments_ingested'
+
+def ensure_watermark_table(conn):
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_watermark (
+            source VARCHAR(50) PRIMARY KEY,
+            high_water_mark TIMESTAMP,
+            revision BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMPTZ DEFAULT NOW()
+        );
+    """)
+    conn.commit()
+    cursor.close()
+
+def advance_watermark(cursor, end_time):
+    """
+    Bumps the swis_moments revision and returns it. The row stays locked until
+    commit, so revisions become visible in the order they were handed out.
+    """
+    cursor.execute("""
+        INSERT INTO ingest_watermark (source, high_water_mark, revision, updated_at)
+        VALUES (%s, %s, 1, NOW())
+        ON CONFLICT (source) DO UPDATE SET
+            high_water_mark = GREATEST(ingest_watermark.high_water_mark, EXCLUDED.high_water_mark),
+            revision = ingest_watermark.revision + 1,
+            updated_at = NOW()
+        RETURNING revision;
+    """, (WATERMARK_SOURCE, end_time))
+    return cursor.fetchone()[0]
+
+# Tables written outside the feeder (alerts by detection, cme_events by the
+# scraper) get a statement-level trigger that bumps their own row in
+# ingest_watermark and sends NOTIFY on REVISION_CHANNEL, whoever the writer is.
+REVISION_CHANNEL = 'data_changed'
+REVISION_TABLES = ('alerts', 'cme_events')
+
+def ensure_revision_triggers(conn):
+    """Installs the revision triggers on the REVISION_TABLES that exist."""
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        CREATE OR REPLACE FUNCTION bump_data_revision() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO ingest_watermark (source, revision, updated_at)
+            VALUES (TG_TABLE_NAME, 1, NOW())
+            ON CONFLICT (source) DO UPDATE SET
+                revision = ingest_watermark.revision + 1,
+                updated_at = NOW();
+            PERFORM pg_notify('{REVISION_CHANNEL}', TG_TABLE_NAME);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    for table in REVISION_TABLES:
+        cursor.execute("SELECT to_regclass(%s);", (table,))
+        if cursor.fetchone()[0] is None:
+            continue
+        # DROP + CREATE rather than CREATE OR REPLACE TRIGGER (PostgreSQL 14+);
+        # both run in this transaction, so no change goes uncounted in between
+        cursor.execute(f"DROP TRIGGER IF EXISTS {table}_revision ON {table};")
+        cursor.execute(f"""
+            CREATE TRIGGER {table}_revision
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+            FOR EACH STATEMENT EXECUTE PROCEDURE bump_data_revision();
+        """)
+        # A tracked table always has a row, even before its first change
+        cursor.execute("""
+            INSERT INTO ingest_watermark (source, revision) VALUES (%s, 0)
+            ON CONFLICT (source) DO NOTHING;
+        """, (table,))
+    conn.commit()
+    cursor.close()
+
+def notify_new_data(cursor, files, rows):
+    """
+    Publishes the current watermark on NOTIFY_CHANNEL. Postgres only delivers the
+    notification when the surrounding transaction commits.
+    """
+    cursor.execute("SELECT high_water_mark, revision FROM ingest_watermark WHERE source = %s", (WATERMARK_SOURCE,))
+    row = cursor.fetchone()
+    if row is None:
+        return
+    payload = json.dumps({
+        'high_water_mark': row[0].isoformat() if row[0] else None,
+        'revision': row[1],
+        'files': files,
+        'rows': rows
+    })
+    cursor.execute("SELECT pg_notify(%s, %s);", (NOTIFY_CHANNEL, payload))
+
+def write_cdf_file(cursor, filepath, fingerprint, previous, bulk=False, use_cache=False, chunk_size=None):
+    """
+    Writes one CDF file to swis_moments on the caller's cursor, first deleting
+    the time range the previous load of it wrote, then refreshes the rollups,
+    advances the watermark and records the manifest entry.
+    Returns (rows decoded, added, removed, end_time).
+    """
+    total = 0
+    records_added = 0
+    records_removed = 0
+    start_time = end_time = None
+
+    if previous and previous['start_time'] is not None:
+        cursor.execute("""
+            DELETE FROM swis_moments
+            WHERE observation_time BETWEEN %s AND %s
+        """, (previous['start_time'], previous['end_time']))
+        records_removed = cursor.rowcount
+        print(f"  Replacing {previous['filename']}: removed {cursor.rowcount} rows "
+              f"({previous['start_time']} to {previous['end_time']})")
+
+    for batch in iter_cdf_batches(filepath, chunk_size=chunk_size, use_cache=use_cache):
+        rows = batch_size(batch)
+        if rows == 0:
+            continue
+
+        if bulk:
+            records_added += copy_batch(cursor, batch)
+        else:
+            records_added += insert_batch(cursor, batch)
 
-def process_cdf_file(filepath):
-    print(f"  Processing: {filepath}...")
-    
+        # Track the time span written for the manifest
+        times = batch["observation_time"]
+        first, last = times.min().item(), times.max().item()
+        start_time = first if start_time is None else min(start_time, first)
+        end_time = last if end_time is None else max(end_time, last)
+        total += rows
+
+    # Re-aggregate the rollup buckets covering everything removed or written
+    refresh_range = [t for t in (start_time, end_time) if t is not None]
+    if previous and previous['start_time'] is not None:
+        refresh_range += [previous['start_time'], previous['end_time']]
+    if refresh_range:
+        rollups.refresh_rollups(cursor, min(refresh_range), max(refresh_range))
+
+    # A replacement that writes no rows still removed the old ones: the
+    # revision must move (GREATEST ignores the NULL end_time)
+    revision = None
+    if end_time is not None or (previous and previous['start_time'] is not None):
+        revision = advance_watermark(cursor, end_time)
+    record_manifest(cursor, fingerprint, total, start_time, end_time, filepath, revision)
+    return total, records_added, records_removed, end_time
+
+def process_cdf_file(conn, filepath, bulk=False, force=False, use_cache=False, chunk_size=None, commit=True):
+    """
+    Decodes one CDF file and writes it to swis_moments in a single transaction,
+    unless the manifest shows it is already loaded. A newer version (or changed
+    content) first deletes exactly the time range the previous load wrote.
+    With chunk_size the file is streamed to the writer in record chunks.
+    With commit=False the file is written inside a savepoint of the caller's
+    transaction, so several files can share one commit.
+    Returns a stats dict (rows decoded, added and removed, elapsed seconds, skip reason).
+    """
+    start = time.perf_counter()
+    total = records_added = records_removed = 0
+    end_time = None
+
+    cursor = conn.cursor()
+    if not commit:
+        cursor.execute("SAVEPOINT ingest_file;")
     try:
-        cdf = cdflib.CDF(filepath)
-        
-        # Use correct CDF variable names
-        epochs = cdf.varget("epoch_for_cdf_mod") 
-        p_density = cdf.varget("proton_density")
-        p_speed = cdf.varget("proton_bulk_speed")
-        p_temp = cdf.varget("proton_thermal")
-        
-        a_density = cdf.varget("alpha_density")
-        a_speed = cdf.varget("alpha_bulk_speed")
-        a_temp = cdf.varget("alpha_thermal")
-        
-        sc_x = cdf.varget("spacecraft_xpos")
-        sc_y = cdf.varget("spacecraft_ypos")
-        sc_z = cdf.varget("spacecraft_zpos")
+        action, fingerprint, previous = check_manifest(cursor, filepath, force=force)
+        skipped = action if action in ('unchanged', 'superseded') else None
+        if skipped is None:
+            total, records_added, records_removed, end_time = write_cdf_file(
+                cursor, filepath, fingerprint, previous,
+                bulk=bulk, use_cache=use_cache, chunk_size=chunk_size)
+    except Exception:
+        if commit:
+            conn.rollback()
+        else:
+            cursor.execute("ROLLBACK TO SAVEPOINT ingest_file;")
+        raise
+    else:
+        # Skipped files end their transaction or savepoint like written ones
+        if commit:
+            conn.commit()
+        else:
+            cursor.execute("RELEASE SAVEPOINT ingest_file;")
+    finally:
+        cursor.close()
 
-        # Convert CDF Epoch to Python Datetime objects
-        timestamps = cdflib.cdfepoch.to_datetime(epochs)
-        
-        records_added = 0
-        
-        for i in range(len(timestamps)):
-            
-            # Skip rows with bad data (Fill Values are often -1.0E31)
-            # Also check for valid speed range
-            if p_speed[i] < 0 or p_speed[i] > 2000: 
-                continue
+    return {
+        'file': filepath,
+        'rows': total,
+        'added': records_added,
+        'removed': records_removed,
+        'elapsed': time.perf_counter() - start,
+        'skipped': skipped,
+        'end_time': end_time
+    }
 
-            sql = """
-                INSERT INTO swis_moments 
-                (observation_time, proton_density, proton_speed, proton_thermal_speed, alpha_density, alpha_speed, alpha_thermal_speed, sc_x, sc_y, sc_z)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT DO NOTHING;
-            """
-            
-            # Explicitly convert numpy types to Python float/int for SQL compatibility
-            # Convert numpy.datetime64 to python datetime
-            ts = timestamps[i]
-            if hasattr(ts, 'item'):
-                ts = ts.item()
-                
-            # If it's still an integer (nanoseconds), convert to datetime
-            if isinstance(ts, int):
-                # Assuming nanoseconds if it's huge
-                if ts > 1e18: 
-                    ts = datetime.fromtimestamp(ts / 1e9)
+def collect_cdf_files(folder_path, verbose=True):
+    """Lists the .cdf files in a folder, skipping V01 files superseded by a V02."""
+    files = sorted(os.listdir(folder_path))
+    selected = []
+
+    for filename in files:
+        if filename.endswith(".cdf"):
             
-            data = (
-                ts,
-                float(p_density[i]),
-                float(p_speed[i]),
-                float(p_temp[i]),
-                float(a_density[i]),
-                float(a_speed[i]),
-                float(a_temp[i]),
-                float(sc_x[i]),
-                float(sc_y[i]),
-                float(sc_z[i])
-            )
+            # If V01 and V02 both exist, skip V01
+            if "V01" in filename:
+                v2_name = filename.replace("V01", "V02")
+                if v2_name in files:
+                    if verbose:
+                        print(f"  Skipping {filename} (Newer V02 exists)")
+                    continue
             
-            cursor.execute(sql, data)
-            records_added += 1
+            selected.append(os.path.join(folder_path, filename))
+    return selected
 
-        conn.commit()
-        print(f"   Success! Inserted {records_added} rows.")
+# --- PARALLEL WORKERS ---
+# Each worker process decodes files and writes them over its own connection
+
+_worker_conn = None
 
+def _init_worker():
+    global _worker_conn
+    _worker_conn = get_db_connection()
+    atexit.register(_worker_conn.close)
+
+def _ingest_in_worker(filepath, options):
+    try:
+        return process_cdf_file(_worker_conn, filepath, **options), None
     except Exception as e:
-        print(f"   Error processing file: {e}")
-        conn.rollback()
+        return {'file': filepath}, str(e)
+
+def _report(done, total, stats, error):
+    name = os.path.basename(stats['file'])
+    if error:
+        print(f"  [{done}/{total}] {name}: Error processing file: {error}")
+        return
+    if stats['skipped']:
+        print(f"  [{done}/{total}] {name}: Skipped ({stats['skipped']})")
+        return
+    rate = stats['rows'] / stats['elapsed'] if stats['elapsed'] > 0 else 0.0
+    print(f"  [{done}/{total}] {name}: Inserted {stats['added']} of {stats['rows']} rows "
+          f"in {stats['elapsed']:.2f}s ({rate:,.0f} rows/s).")
+
+def ingest_files(filepaths, workers=1, progress=None, **options):
+    """
+    Ingests a list of CDF files, either sequentially on one connection or on a
+    pool of `workers` processes. `options` (bulk, force, use_cache, chunk_size)
+    are passed to process_cdf_file. `progress(done, total, stats, error)` is
+    called after each file; an exception raised from it stops the run.
+    Returns the list of per-file stats.
+    """
+    total = len(filepaths)
+    results = []
+    start = time.perf_counter()
+
+    if workers > 1 and total > 1:
+        print(f"\n Ingesting {total} files with {workers} workers...")
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            futures = [pool.submit(_ingest_in_worker, path, options) for path in filepaths]
+            try:
+                for done, future in enumerate(as_completed(futures), start=1):
+                    stats, error = future.result()
+                    _report(done, total, stats, error)
+                    if not error:
+                        results.append(stats)
+                    if progress:
+                        progress(done, total, stats, error)
+            except BaseException:
+                pool.shutdown(cancel_futures=True)
+                raise
+    else:
+        conn = get_db_connection()
+        try:
+            for done, path in enumerate(filepaths, start=1):
+                try:
+                    stats, error = process_cdf_file(conn, path, **options), None
+                except Exception as e:
+                    stats, error = {'file': path}, str(e)
+                _report(done, total, stats, error)
+                if not error:
+                    results.append(stats)
+                if progress:
+                    progress(done, total, stats, error)
+        finally:
+            conn.close()
+
+    elapsed = time.perf_counter() - start
+    rows = sum(r['rows'] for r in results)
+    skipped = sum(1 for r in results if r['skipped'])
+    rate = rows / elapsed if elapsed > 0 else 0.0
+    print(f"\n {len(results) - skipped}/{total} files ingested ({skipped} unchanged or superseded), "
+          f"{rows} rows in {elapsed:.2f}s ({rate:,.0f} rows/s).")
+
+    if rows or any(r.get('removed') for r in results):
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            notify_new_data(cursor, len(results) - skipped, rows)
+            conn.commit()
+        finally:
+            conn.close()
+    return results
 
-def main():
-    base_folder = "E:\Programming\CME-Detection\data\SWIS-ISSDC"
+def ensure_ingest_schema(conn):
+    """Creates the constraint and bookkeeping tables ingestion relies on."""
+    ensure_unique_constraint(conn)
+    ensure_manifest_table(conn)
+    ensure_watermark_table(conn)
+    ensure_revision_triggers(conn)
+    rollups.ensure_rollup_tables(conn)
+
+# --- WATCH MODE ---
+
+def ingest_batch(conn, filepaths, **options):
+    """
+    Ingests several files in one transaction (one savepoint per file, so a bad
+    file does not discard the others), advances the watermark and notifies
+    listeners on commit. Returns the list of (stats, error) per file.
+    """
+    outcomes = []
+    for path in filepaths:
+        try:
+            outcomes.append((process_cdf_file(conn, path, commit=False, **options), None))
+        except Exception as e:
+            outcomes.append(({'file': path}, str(e)))
+
+    loaded = [stats for stats, error in outcomes if not error and not stats['skipped']]
+    cursor = conn.cursor()
+    if loaded:
+        notify_new_data(cursor, len(loaded), sum(stats['rows'] for stats in loaded))
+    conn.commit()
+    cursor.close()
+    return outcomes
+
+def run_detection():
+    # Imported lazily: plain ingestion does not need the detector
+    import detection
+    detection.run_incremental_analysis()
+
+def watch_directory(folder_path, interval=5.0, settle=10.0, max_batch=20, detect=False, max_backoff=300.0, **options):
+    """
+    Polls a folder for new or replaced .cdf files and ingests them in batches.
+    A file is only picked up once its size and mtime have stayed the same for
+    `settle` seconds, so partially written downloads are never read.
+    With `detect`, incremental CME detection runs after every batch that added rows.
+    Errors never stop the watcher: a file that fails stays pending and is retried
+    after a growing delay, and a failed poll (e.g. the database went away) is
+    rolled back and retried on a new connection with exponential backoff.
+    """
+    print(f"\n Watching {folder_path} (poll {interval}s, settle {settle}s). Ctrl+C to stop.")
+    observed = {}  # path -> (size, mtime, unchanged since)
+    handled = {}   # path -> (size, mtime) last ingested
+    failures = {}  # path -> (failed attempts, retry not before)
+    detection_due = False
+    backoff = interval
+    conn = None
+
+    try:
+        while True:
+            try:
+                if conn is None or conn.closed:
+                    conn = get_db_connection()
+                    print(" Connected to PostgreSQL.")
+
+                now = time.time()
+                ready = []
+                for path in collect_cdf_files(folder_path, verbose=False):
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    signature = (stat.st_size, stat.st_mtime)
+
+                    if handled.get(path) == signature:
+                        continue
+                    if path not in observed or observed[path][:2] != signature:
+                        observed[path] = (*signature, now)
+                        failures.pop(path, None)  # A replaced file gets a fresh start
+                        continue
+                    if now - observed[path][2] >= settle and failures.get(path, (0, 0))[1] <= now:
+                        ready.append(path)
+
+                for first in range(0, len(ready), max_batch):
+                    batch_paths = ready[first:first + max_batch]
+                    outcomes = ingest_batch(conn, batch_paths, **options)
+                    for done, (stats, error) in enumerate(outcomes, start=1):
+                        _report(done, len(outcomes), stats, error)
+                        path = stats['file']
+                        if error:
+                            attempts = failures.get(path, (0, 0))[0] + 1
+                            delay = min(interval * 2 ** attempts, max_backoff)
+                            failures[path] = (attempts, time.time() + delay)
+                            print(f"  {os.path.basename(path)} stays pending, retry in {delay:g}s.")
+                        else:
+                            failures.pop(path, None)
+                            handled[path] = observed.pop(path)[:2]
+                    if detect and any(stats['added'] for stats, error in outcomes if not error):
+                        detection_due = True
+
+                # Kept due until it succeeds, even if no further files arrive
+                if detection_due:
+                    run_detection()
+                    detection_due = False
+                backoff = interval
+            except Exception as e:
+                print(f" Watch error: {e}. Retrying in {backoff:g}s.")
+                if conn is not None and not conn.closed:
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        conn.close()
+                time.sleep(backoff)
+                backoff = min(backoff * 2, max_backoff)
+                continue
+
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("\n Watch stopped.")
+    finally:
+        if conn is not None:
+            conn.close()
+
+def main(base_folder=DATA_DIR, workers=1, detect=False, **options):
     subfolders = ["positive", "negative"]
+    filepaths = []
 
     for sub in subfolders:
         folder_path = os.path.join(base_folder, sub)
@@ -125,42 +733,56 @@ def main():
             continue
             
         print(f"\n Scanning folder: {folder_path}")
-        files = sorted(os.listdir(folder_path))
-        
-        for filename in files:
-            if filename.endswith(".cdf"):
-                
-                # If V01 and V02 both exist, skip V01
-                if "V01" in filename:
-                    v2_name = filename.replace("V01", "V02")
-                    if v2_name in files:
-                        print(f"  Skipping {filename} (Newer V02 exists)")
-                        continue
-                
-                full_path = os.path.join(folder_path, filename)
-                process_cdf_file(full_path)
+        filepaths.extend(collect_cdf_files(folder_path))
 
-    cursor.close()
-    conn.close()
+    results = ingest_files(filepaths, workers=workers, **options)
     print("\n All files processed. Database is populated!")
+    if detect and any(r['added'] for r in results):
+        run_detection()
 
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("--dir", type=str, help="Directory containing CDF files to process")
+    parser.add_argument("--bulk", action="store_true", help="Load each file with one COPY + merge instead of per-row INSERTs")
+    parser.add_argument("--force", action="store_true", help="Re-ingest files even if the manifest shows them unchanged")
+    parser.add_argument("--cache", action="store_true", help="Read decoded variables from (and build) the .npcache next to each CDF")
+    parser.add_argument("--chunk-size", type=int, default=None, help="Stream each file in chunks of this many records to bound memory")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes decoding and writing files in parallel")
+    parser.add_argument("--detect", action="store_true", help="Run incremental CME detection on the new rows after ingesting")
+    parser.add_argument("--watch", type=str, help="Keep running and ingest new or replaced CDF files dropped into this directory")
+    parser.add_argument("--interval", type=float, default=5.0, help="Watch mode: seconds between directory polls")
+    parser.add_argument("--settle", type=float, default=10.0, help="Watch mode: seconds a file must stay unchanged before it is ingested")
+    parser.add_argument("--max-batch", type=int, default=20, help="Watch mode: maximum files committed in one transaction")
     args = parser.parse_args()
 
-    if args.dir:
+    try:
+        conn = get_db_connection()
+        print("Connected to PostgreSQL successfully.")
+        ensure_ingest_schema(conn)
+        conn.close()
+    except Exception as e:
+        print(f"Database connection failed: {e}")
+        exit()
+
+    options = {'bulk': args.bulk, 'force': args.force, 'use_cache': args.cache, 'chunk_size': args.chunk_size}
+
+    if args.watch:
+        # Daemon mode (near-real-time drops)
+        if os.path.exists(args.watch):
+            watch_directory(args.watch, interval=args.interval, settle=args.settle,
+                            max_batch=args.max_batch, detect=args.detect, **options)
+        else:
+            print(f"Directory not found: {args.watch}")
+    elif args.dir:
         # Custom directory mode (for web uploads)
         if os.path.exists(args.dir):
             print(f"Scanning provided directory: {args.dir}")
-            for filename in sorted(os.listdir(args.dir)):
-                if filename.endswith(".cdf"):
-                     process_cdf_file(os.path.join(args.dir, filename))
-            cursor.close()
-            conn.close()
+            results = ingest_files(collect_cdf_files(args.dir), workers=args.workers, **options)
+            if args.detect and any(r['added'] for r in results):
+                run_detection()
         else:
             print(f"Directory not found: {args.dir}")
     else:
         # Default recursive scan mode
-        main()
+        main(workers=args.workers, detect=args.detect, **options)
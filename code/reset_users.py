@@ -52,6 +52,8 @@ def reset_users():
                     VALUES (%s, %s, %s, %s, %s)
                 """, (username, pwd_hash, role_id, email, fullname))
                 
+        # Tell running web apps to drop their cached users (delivered on commit)
+        cur.execute("SELECT pg_notify('users_changed', '')")
         conn.commit()
         conn.close()
         print("Users reset successfully.")
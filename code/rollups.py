@@ -0,0 +1,236 @@
+import os
+import pandas as pd
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# DATABASE CONNECTION
+DB_URI = os.getenv('DB_URI')
+
+# Pre-aggregated copies of swis_moments at 1-minute, 1-hour and 1-day
+# resolution, so long-range reads (training data, backtests, zoomed-out
+# telemetry) touch a few thousand rollup rows instead of every raw sample.
+#
+# Each bucket stores SUM/COUNT/MIN/MAX per column (NaN is treated as missing,
+# like pandas' mean), and the mean is a generated column. Sums and counts add
+# up exactly, so the 1h level is built from the 1min level and 1d from 1h.
+# Ingestion calls refresh_rollups() for the time range it wrote, inside the
+# same transaction, which recomputes only the buckets touching that range.
+
+ROLLUP_COLUMNS = ['proton_speed', 'proton_density', 'proton_thermal_speed', 'alpha_density',
+                  'sc_x', 'sc_y', 'sc_z']
+
+# name -> (date_trunc unit, bucket width), finest first
+RESOLUTIONS = {
+    '1min': ('minute', pd.Timedelta(minutes=1)),
+    '1h': ('hour', pd.Timedelta(hours=1)),
+    '1d': ('day', pd.Timedelta(days=1))
+}
+
+# Serializes rollup refreshes: two ingest workers refreshing the same day bucket
+# would otherwise each aggregate without the other's uncommitted rows.
+ROLLUP_LOCK_ID = 7202001
+
+def table_name(resolution):
+    return f"swis_rollup_{resolution}"
+
+# --- SCHEMA ---
+def _create_table_sql(resolution):
+    columns = []
+    for col in ROLLUP_COLUMNS:
+        columns += [
+            f"{col}_sum DOUBLE PRECISION",
+            f"{col}_count INT NOT NULL DEFAULT 0",
+            f"{col}_min DOUBLE PRECISION",
+            f"{col}_max DOUBLE PRECISION",
+            f"{col}_mean DOUBLE PRECISION GENERATED ALWAYS AS ({col}_sum / NULLIF({col}_count, 0)) STORED"
+        ]
+    return f"""
+        CREATE TABLE IF NOT EXISTS {table_name(resolution)} (
+            bucket TIMESTAMP PRIMARY KEY,
+            samples INT NOT NULL,
+            {', '.join(columns)}
+        );
+    """
+
+def ensure_rollup_tables(conn):
+    """Creates missing rollup tables and backfills them from swis_moments."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT " + ", ".join(f"to_regclass('{table_name(r)}')" for r in RESOLUTIONS))
+    missing = any(name is None for name in cursor.fetchone())
+    for resolution in RESOLUTIONS:
+        cursor.execute(_create_table_sql(resolution))
+    conn.commit()
+    cursor.close()
+
+    if missing:
+        rebuild_rollups(conn)
+
+# --- MAINTENANCE ---
+def _aggregate_sql(resolution, source):
+    """INSERT ... SELECT of one level from swis_moments or from the next finer level."""
+    unit = RESOLUTIONS[resolution][0]
+    targets = ['bucket', 'samples']
+    if source == 'swis_moments':
+        time_col = 'observation_time'
+        selects = [f"date_trunc('{unit}', observation_time)", "COUNT(*)"]
+        for col in ROLLUP_COLUMNS:
+            value = f"NULLIF({col}, 'NaN')"
+            selects += [f"SUM({value})", f"COUNT({value})", f"MIN({value})", f"MAX({value})"]
+    else:
+        time_col = 'bucket'
+        selects = [f"date_trunc('{unit}', bucket)", "SUM(samples)"]
+        for col in ROLLUP_COLUMNS:
+            selects += [f"SUM({col}_sum)", f"SUM({col}_count)", f"MIN({col}_min)", f"MAX({col}_max)"]
+    for col in ROLLUP_COLUMNS:
+        targets += [f"{col}_sum", f"{col}_count", f"{col}_min", f"{col}_max"]
+
+    return f"""
+        INSERT INTO {table_name(resolution)} ({', '.join(targets)})
+        SELECT {', '.join(selects)}
+        FROM {source}
+        WHERE {time_col} >= %(lo)s AND {time_col} < %(hi)s
+        GROUP BY 1;
+    """
+
+def refresh_rollups(cursor, start_time, end_time):
+    """
+    Recomputes every bucket overlapping [start_time, end_time] at all three
+    resolutions. Call it after writing or deleting raw rows in that range, on
+    the same cursor, before the transaction commits.
+    """
+    cursor.execute("SELECT pg_advisory_xact_lock(%s);", (ROLLUP_LOCK_ID,))
+    source = 'swis_moments'
+    for resolution, (unit, width) in RESOLUTIONS.items():
+        lo = pd.Timestamp(start_time).floor(width).to_pydatetime()
+        hi = (pd.Timestamp(end_time).floor(width) + width).to_pydatetime()
+        cursor.execute(f"DELETE FROM {table_name(resolution)} WHERE bucket >= %s AND bucket < %s;", (lo, hi))
+        cursor.execute(_aggregate_sql(resolution, source), {'lo': lo, 'hi': hi})
+        source = table_name(resolution)
+
+def rebuild_rollups(conn):
+    """Recomputes all rollups from swis_moments (initial backfill or repair)."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT MIN(observation_time), MAX(observation_time) FROM swis_moments")
+    start_time, end_time = cursor.fetchone()
+    for resolution in RESOLUTIONS:
+        cursor.execute(f"TRUNCATE {table_name(resolution)};")
+    if start_time is not None:
+        print(f" Building rollups for {start_time} to {end_time}...")
+        refresh_rollups(cursor, start_time, end_time)
+    conn.commit()
+    cursor.close()
+
+# --- QUERIES ---
+def fetch_rollup(conn, resolution, columns=ROLLUP_COLUMNS, start_time=None, end_time=None, stat='mean'):
+    """
+    One rollup level as a DataFrame of observation_time (bucket start) plus
+    `columns` holding the chosen statistic. Empty buckets have no row.
+    """
+    query = f"""
+        SELECT bucket AS observation_time, {', '.join(f'{col}_{stat} AS {col}' for col in columns)}
+        FROM {table_name(resolution)}
+    """
+    params = ()
+    if start_time is not None and end_time is not None:
+        query += " WHERE bucket BETWEEN %s AND %s"
+        params = (start_time, end_time)
+    query += " ORDER BY bucket ASC;"
+    return pd.read_sql(query, conn, params=params)
+
+def pick_resolution(start_time, end_time, max_points):
+    """
+    Coarsest rollup level that still yields about `max_points` buckets over the
+    range, or None when even 1-minute buckets are too coarse (read swis_moments).
+    """
+    width = (pd.Timestamp(end_time) - pd.Timestamp(start_time)) / max(max_points, 1)
+    chosen = None
+    for resolution, (unit, bucket_width) in RESOLUTIONS.items():
+        if bucket_width <= width:
+            chosen = resolution
+    return chosen
+
+def fetch_series(conn, start_time, end_time, max_points, columns=ROLLUP_COLUMNS, peaks_of='proton_speed'):
+    """
+    Aggregates the range into at most `max_points` equal time buckets, read
+    from the coarsest sufficient rollup level. Each bucket has
+    <col>_mean/_min/_max/_count per column, plus the rollup times at which
+    `peaks_of` reached its min and max. Returns (DataFrame, resolution);
+    the DataFrame is None when the span of data is too short for rollups.
+    Only whole coarse buckets inside the range are used; the partial ones at
+    either end are read from the 1-minute level, so samples outside the range
+    (to the minute) are never counted.
+    """
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT MIN(bucket), MAX(bucket) FROM {table_name('1min')}
+        WHERE bucket BETWEEN date_trunc('minute', %s::timestamp) AND %s
+    """, (start_time, end_time))
+    first, last = cursor.fetchone()
+    cursor.close()
+    if first is None:
+        return pd.DataFrame(), None
+
+    minute = RESOLUTIONS['1min'][1]
+    resolution = pick_resolution(first, last + minute, max_points)
+    if resolution is None:
+        return None, None
+
+    # Coarse buckets lying wholly within [first, last + 1 minute)
+    width = RESOLUTIONS[resolution][1]
+    inner_lo = pd.Timestamp(first).ceil(width).to_pydatetime()
+    inner_hi = max((pd.Timestamp(last) + minute).floor(width).to_pydatetime(), inner_lo)
+
+    fields = ['bucket', 'samples']
+    for col in columns:
+        fields += [f"{col}_sum", f"{col}_count", f"{col}_min", f"{col}_max"]
+    fields = ', '.join(fields)
+
+    selects = ["MIN(bucket) AS observation_time", "SUM(samples) AS samples"]
+    for col in columns:
+        selects += [
+            f"SUM({col}_sum) / NULLIF(SUM({col}_count), 0) AS {col}_mean",
+            f"MIN({col}_min) AS {col}_min",
+            f"MAX({col}_max) AS {col}_max",
+            f"SUM({col}_count) AS {col}_count"
+        ]
+    if peaks_of:
+        selects += [
+            f"(ARRAY_AGG(bucket ORDER BY {peaks_of}_min ASC NULLS LAST))[1] AS {peaks_of}_min_time",
+            f"(ARRAY_AGG(bucket ORDER BY {peaks_of}_max DESC NULLS LAST))[1] AS {peaks_of}_max_time"
+        ]
+    query = f"""
+        WITH source AS (
+            SELECT {fields} FROM {table_name(resolution)}
+            WHERE bucket >= %(inner_lo)s AND bucket < %(inner_hi)s
+            UNION ALL
+            SELECT {fields} FROM {table_name('1min')}
+            WHERE bucket >= %(first)s AND bucket <= %(last)s
+              AND (bucket < %(inner_lo)s OR bucket >= %(inner_hi)s)
+        )
+        SELECT {', '.join(selects)}
+        FROM source
+        GROUP BY width_bucket(EXTRACT(EPOCH FROM bucket),
+                              EXTRACT(EPOCH FROM %(first)s::timestamp),
+                              EXTRACT(EPOCH FROM %(last)s::timestamp) + 0.001, %(buckets)s)
+        ORDER BY 1 ASC;
+    """
+    params = {'first': first, 'last': last, 'inner_lo': inner_lo, 'inner_hi': inner_hi, 'buckets': max_points}
+    df = pd.read_sql(query, conn, params=params)
+    return df, resolution
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Create and backfill the swis_moments rollup tables")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute every rollup from swis_moments")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(DB_URI)
+    try:
+        ensure_rollup_tables(conn)
+        if args.rebuild:
+            rebuild_rollups(conn)
+        print(" Rollups are up to date.")
+    finally:
+        conn.close()
@@ -56,18 +56,41 @@ def setup_database():
                 timestamp TIMESTAMPTZ DEFAULT NOW()
             );
         """)
+        # 5. Create Background Jobs Table (web app job queue, see web_app/jobs.py)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS background_jobs (
+                job_id VARCHAR(32) PRIMARY KEY,
+                kind VARCHAR(50) NOT NULL,
+                owner INT REFERENCES users(user_id),
+                description TEXT,
+                status VARCHAR(20) NOT NULL DEFAULT 'queued',
+                cancel_requested BOOLEAN NOT NULL DEFAULT FALSE,
+                progress JSONB NOT NULL DEFAULT '{"done": 0, "total": null, "message": ""}',
+                result JSONB,
+                error TEXT,
+                runner VARCHAR(100),
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                started_at TIMESTAMPTZ,
+                finished_at TIMESTAMPTZ,
+                heartbeat_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS background_jobs_active ON background_jobs (status)
+            WHERE status IN ('queued', 'running');
+        """)
         print("Tables created successfully.")
 
-        # 5. Insert Roles
+        # 6. Insert Roles
         roles = ['scientist', 'viewer']
         for role in roles:
             cur.execute("INSERT INTO roles (role_name) VALUES (%s) ON CONFLICT (role_name) DO NOTHING;", (role,))
         
-        # 6. Get Role IDs
+        # 7. Get Role IDs
         cur.execute("SELECT role_id, role_name FROM roles;")
         role_map = {name: r_id for r_id, name in cur.fetchall()}
         
-        # 7. Insert Default Users
+        # 8. Insert Default Users
         admin_pass = os.getenv('ADMIN_PASSWORD', 'admin123')
         guest_pass = os.getenv('GUEST_PASSWORD', 'guest123')
         
@@ -4,6 +4,7 @@ import tensorflow as tf
 import psycopg2
 import pickle
 import os
+import rollups
 from sklearn.preprocessing import MinMaxScaler
 from dotenv import load_dotenv
 
@@ -19,12 +20,9 @@ DB_URI = os.getenv('DB_URI')
 
 def get_data():
     conn = psycopg2.connect(DB_URI)
-    query = """
-        SELECT observation_time, proton_speed, proton_density, proton_thermal_speed, alpha_density
-        FROM swis_moments
-        ORDER BY observation_time ASC;
-    """
-    df = pd.read_sql(query, conn)
+    # Hourly means from the rollup table, the same input train_model uses
+    rollups.ensure_rollup_tables(conn)
+    df = rollups.fetch_rollup(conn, '1h', ['proton_speed', 'proton_density', 'proton_thermal_speed', 'alpha_density'])
     conn.close()
     return df
 
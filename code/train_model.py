@@ -4,7 +4,10 @@ import psycopg2
 import tensorflow as tf
 from sklearn.preprocessing import MinMaxScaler
 import os
+import json
 import pickle
+import rollups
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -15,9 +18,24 @@ DB_URI = os.getenv('DB_URI')
 # HYPERPARAMETERS
 LOOKBACK_HOURS = 24  # Use past 24 hours to predict
 FORECAST_HORIZON = 1 # Predict next 1 hour
+# Direct multi-horizon mode: predict the next N hours of speed in one pass
+# (Dense(N) head). 0 keeps the single-step model the app rolls forward.
+DIRECT_HORIZON = int(os.getenv('TRAIN_DIRECT_HORIZON', 0))
 EPOCHS = 20
 BATCH_SIZE = 32
 
+FEATURE_COLUMNS = ['proton_speed', 'proton_density', 'proton_thermal_speed', 'alpha_density']
+
+# With --progress, one line per epoch for a parent process (the web app's training job)
+PROGRESS_PREFIX = 'PROGRESS '
+
+class ProgressLines(tf.keras.callbacks.Callback):
+    """Prints PROGRESS_PREFIX + {"epoch", "epochs", "loss"} as JSON after every epoch."""
+
+    def on_epoch_end(self, epoch, logs=None):
+        progress = {'epoch': epoch + 1, 'epochs': self.params.get('epochs'), 'loss': (logs or {}).get('loss')}
+        print(PROGRESS_PREFIX + json.dumps(progress), flush=True)
+
 def get_db_connection():
     return psycopg2.connect(DB_URI)
 
@@ -25,15 +43,13 @@ def fetch_training_data():
     print("Connecting to Database...")
     conn = get_db_connection()
     
-    query = """
-        SELECT observation_time, proton_speed, proton_density, proton_thermal_speed, alpha_density
-        FROM swis_moments
-        ORDER BY observation_time ASC;
-    """
-    df = pd.read_sql(query, conn)
+    # Hourly means straight from the rollup table (see rollups.py); the
+    # resample in preprocess_data only fills in the hours without data
+    rollups.ensure_rollup_tables(conn)
+    df = rollups.fetch_rollup(conn, '1h', FEATURE_COLUMNS)
     conn.close()
     
-    print(f"Loaded {len(df)} raw data points.")
+    print(f"Loaded {len(df)} hourly data points.")
     return df
 
 def preprocess_data(df):
@@ -50,30 +66,50 @@ def preprocess_data(df):
     print(f"Resampled to {len(df_resampled)} hourly points.")
     return df_resampled
 
-def create_sequences(data, lookback, horizon):
+def create_sequences(data, lookback, horizon, direct=False):
+    """
+    Input windows and speed targets: the speed `horizon` hours ahead, or with
+    `direct` the speeds of all of the next `horizon` hours (y shape (n, horizon)).
+    """
     X, y = [], []
     for i in range(len(data) - lookback - horizon + 1):
         X.append(data[i : i + lookback])
-        y.append(data[i + lookback + horizon - 1, 0]) 
+        if direct:
+            y.append(data[i + lookback : i + lookback + horizon, 0])
+        else:
+            y.append(data[i + lookback + horizon - 1, 0]) 
     return np.array(X), np.array(y)
 
-def build_model(input_shape):
+def build_model(input_shape, outputs=1):
     model = tf.keras.Sequential([
         tf.keras.layers.LSTM(64, return_sequences=True, input_shape=input_shape),
         tf.keras.layers.Dropout(0.2),
         tf.keras.layers.LSTM(32),
         tf.keras.layers.Dropout(0.2),
-        tf.keras.layers.Dense(1)
+        tf.keras.layers.Dense(outputs)
     ])
     
     model.compile(optimizer='adam', loss='mse')
     return model
 
-def main():
+def save_replacing(path, write):
+    """write(tmp_path), then rename over `path`, so readers never see a half-written file."""
+    root, ext = os.path.splitext(path)
+    tmp_path = f"{root}.tmp{ext}"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+def main(callbacks=None, direct_horizon=DIRECT_HORIZON, verbose=1):
+    """
+    Trains the LSTM on all of swis_moments and saves the model, scaler and
+    model_metadata.json. With `direct_horizon` > 0 the model predicts that
+    many hours at once. Extra Keras `callbacks` are passed to model.fit.
+    Returns the saved model path, or None without data.
+    """
     df = fetch_training_data()
     if df.empty:
         print("No data found. Aborting.")
-        return
+        return None
 
     df_processed = preprocess_data(df)
     
@@ -84,12 +120,11 @@ def main():
     script_dir = os.path.dirname(os.path.abspath(__file__))
     scaler_path = os.path.join(script_dir, 'scaler.pkl')
     model_path = os.path.join(script_dir, 'cme_prediction_model.keras')
+    metadata_path = os.path.join(script_dir, 'model_metadata.json')
 
-    with open(scaler_path, 'wb') as f:
-        pickle.dump(scaler, f)
-    print(f"Scaler saved to {scaler_path}")
-
-    X, y = create_sequences(data_scaled, LOOKBACK_HOURS, FORECAST_HORIZON)
+    direct = direct_horizon > 0
+    horizon = direct_horizon if direct else FORECAST_HORIZON
+    X, y = create_sequences(data_scaled, LOOKBACK_HOURS, horizon, direct=direct)
     print(f"Created {len(X)} training sequences.")
     
     if len(X) < 100:
@@ -100,19 +135,59 @@ def main():
     X_train, X_test = X[:split], X[split:]
     y_train, y_test = y[:split], y[split:]
 
-    print("Training LSTM Model...")
-    model = build_model((X_train.shape[1], X_train.shape[2]))
+    print(f"Training LSTM Model ({f'direct {horizon}h' if direct else 'single-step'})...")
+    model = build_model((X_train.shape[1], X_train.shape[2]), outputs=horizon if direct else 1)
     
     history = model.fit(
         X_train, y_train,
         epochs=EPOCHS,
         batch_size=BATCH_SIZE,
         validation_data=(X_test, y_test),
-        verbose=1
+        callbacks=callbacks,
+        verbose=verbose
     )
 
-    model.save(model_path)
+    # Save the scaler and metadata only alongside a finished model so they always match.
+    # Each file is replaced whole and the metadata goes last: the web app reloads
+    # when it sees the files change (see load_ml_components in web_app/app.py).
+    save_replacing(model_path, model.save)
     print(f"Model saved to {model_path}")
 
+    def write_scaler(path):
+        with open(path, 'wb') as f:
+            pickle.dump(scaler, f)
+    save_replacing(scaler_path, write_scaler)
+    print(f"Scaler saved to {scaler_path}")
+
+    # Tells the web app how to serve the model: rolled forward one hour at a
+    # time ('autoregressive') or all `horizon` hours from one pass ('direct')
+    metadata = {
+        'mode': 'direct' if direct else 'autoregressive',
+        'horizon': horizon,
+        'lookback_hours': LOOKBACK_HOURS,
+        'features': FEATURE_COLUMNS,
+        'sequences': len(X),
+        'trained_at': datetime.now(timezone.utc).isoformat()
+    }
+    def write_metadata(path):
+        with open(path, 'w') as f:
+            json.dump(metadata, f, indent=2)
+    save_replacing(metadata_path, write_metadata)
+    print(f"Metadata saved to {metadata_path}")
+    return model_path
+
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser(description="Train the solar wind speed forecasting LSTM")
+    parser.add_argument("--direct-horizon", type=int, default=DIRECT_HORIZON,
+                        help="Predict this many hours in one pass (Dense(N) head); 0 trains the single-step model")
+    parser.add_argument("--progress", action="store_true",
+                        help="Print one machine-readable PROGRESS line per epoch instead of progress bars")
+    args = parser.parse_args()
+
+    if args.progress:
+        model_path = main(callbacks=[ProgressLines()], direct_horizon=args.direct_horizon, verbose=0)
+    else:
+        model_path = main(direct_horizon=args.direct_horizon)
+    if model_path is None:
+        exit(1)
@@ -22,6 +22,8 @@ def update_schema():
         if not cur.fetchone():
             print("Adding 'full_name' column to users table...")
             cur.execute("ALTER TABLE users ADD COLUMN full_name VARCHAR(100);")
+            # Tell running web apps to drop their cached users (delivered on commit)
+            cur.execute("SELECT pg_notify('users_changed', '')")
             conn.commit()
             print("Column added successfully.")
         else:
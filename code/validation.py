@@ -0,0 +1,205 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# DATABASE CONNECTION
+DB_URI = os.getenv('DB_URI')
+
+# Validation of detected events against the CACTus catalogue (cme_events).
+# A CME is launched at its CACTus onset time and reaches L1 (where SWIS sees it)
+# some time later, so an event "matches" a CME when it starts inside that CME's
+# arrival window: onset + MIN_LAG .. onset + MAX_LAG.
+# Both sides are sorted once and matched with binary search (no nested loops).
+
+MIN_LAG = pd.Timedelta(hours=12)
+MAX_LAG = pd.Timedelta(days=5)
+
+def _as_times(values):
+    return np.sort(np.asarray(values, dtype='datetime64[ns]'))
+
+def score_events(event_starts, cme_times, min_lag=MIN_LAG, max_lag=MAX_LAG):
+    """
+    Counting-only matcher for hot loops (see detection_sweep.py). Both inputs
+    must be sorted datetime64[ns] arrays. Returns (CMEs with at least one
+    event in their window, events inside at least one CME's window).
+    """
+    lo, hi = pd.Timedelta(min_lag).to_timedelta64(), pd.Timedelta(max_lag).to_timedelta64()
+    detected = (np.searchsorted(event_starts, cme_times + hi, side='right')
+                - np.searchsorted(event_starts, cme_times + lo, side='left')) > 0
+    explained = (np.searchsorted(cme_times, event_starts - lo, side='right')
+                 - np.searchsorted(cme_times, event_starts - hi, side='left')) > 0
+    return int(detected.sum()), int(explained.sum())
+
+def match_events(event_starts, cme_times, min_lag=MIN_LAG, max_lag=MAX_LAG):
+    """
+    Matches sorted event start times to sorted CME onset times.
+
+    Returns (cme_match, event_match): for every CME the index of the first
+    event in its window, and for every event the index of the latest CME whose
+    window contains it (the shortest plausible transit). -1 means no match.
+    """
+    lo, hi = pd.Timedelta(min_lag).to_timedelta64(), pd.Timedelta(max_lag).to_timedelta64()
+
+    first = np.searchsorted(event_starts, cme_times + lo, side='left')
+    inside = first < len(event_starts)
+    inside[inside] = event_starts[first[inside]] <= cme_times[inside] + hi
+    cme_match = np.where(inside, first, -1)
+
+    latest = np.searchsorted(cme_times, event_starts - lo, side='right') - 1
+    inside = latest >= 0
+    inside[inside] = cme_times[latest[inside]] >= event_starts[inside] - hi
+    event_match = np.where(inside, latest, -1)
+    return cme_match, event_match
+
+def lag_summary(lags):
+    """Distribution of CME onset -> event start lags, in hours."""
+    if len(lags) == 0:
+        return None
+    hours = lags / np.timedelta64(1, 'h')
+    return {
+        'min': float(hours.min()),
+        'p25': float(np.percentile(hours, 25)),
+        'median': float(np.median(hours)),
+        'p75': float(np.percentile(hours, 75)),
+        'max': float(hours.max()),
+        'mean': float(hours.mean())
+    }
+
+def score(event_starts, cme_times, severities=None, min_lag=MIN_LAG, max_lag=MAX_LAG):
+    """
+    Full validation report for one set of events. `severities` (aligned with
+    event_starts) adds a per-severity breakdown.
+    """
+    order = np.argsort(np.asarray(event_starts, dtype='datetime64[ns]'), kind='stable')
+    event_starts = np.asarray(event_starts, dtype='datetime64[ns]')[order]
+    cme_times = _as_times(cme_times)
+    cme_match, event_match = match_events(event_starts, cme_times, min_lag, max_lag)
+
+    detected = cme_match >= 0
+    matched = event_match >= 0
+    hits = int(detected.sum())
+    false_alarms = int((~matched).sum())
+
+    report = {
+        'window_hours': [pd.Timedelta(min_lag) / pd.Timedelta(hours=1), pd.Timedelta(max_lag) / pd.Timedelta(hours=1)],
+        'events': len(event_starts),
+        'cmes': len(cme_times),
+        'cmes_detected': hits,
+        'hit_rate': hits / len(cme_times) if len(cme_times) else None,
+        'false_alarms': false_alarms,
+        'false_alarm_ratio': false_alarms / len(event_starts) if len(event_starts) else None,
+        # Onset -> first matching event start for each detected CME (the transit time)
+        'lag_hours': lag_summary(event_starts[cme_match[detected]] - cme_times[detected])
+    }
+
+    if severities is not None:
+        severities = np.asarray(severities)[order]
+        report['by_severity'] = {
+            str(level): {
+                'events': int((severities == level).sum()),
+                'false_alarms': int(((severities == level) & ~matched).sum())
+            }
+            for level in np.unique(severities)
+        }
+    return report
+
+# --- DATABASE ---
+def load_alerts(conn, start_date=None, end_date=None):
+    query = "SELECT generated_at, severity FROM alerts"
+    params = ()
+    if start_date and end_date:
+        query += " WHERE generated_at BETWEEN %s AND %s"
+        params = (start_date, end_date)
+    query += " ORDER BY generated_at ASC;"
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    cursor.close()
+    return (np.array([r[0] for r in rows], dtype='datetime64[ns]'),
+            np.array([r[1] for r in rows], dtype=object))
+
+def load_cmes(conn, start_date, end_date, halo_only=True, min_lag=MIN_LAG, max_lag=MAX_LAG):
+    """Onset times of the CMEs that could arrive between start_date and end_date."""
+    query = """
+        SELECT start_time FROM cme_events
+        WHERE start_time BETWEEN %s AND %s
+    """
+    if halo_only:
+        query += " AND is_halo"
+    query += " ORDER BY start_time ASC;"
+    start = pd.Timestamp(start_date) - pd.Timedelta(max_lag)
+    end = pd.Timestamp(end_date) - pd.Timedelta(min_lag)
+    cursor = conn.cursor()
+    cursor.execute(query, (start.to_pydatetime(), end.to_pydatetime()))
+    rows = cursor.fetchall()
+    cursor.close()
+    return np.array([r[0] for r in rows], dtype='datetime64[ns]')
+
+def validate(start_date=None, end_date=None, min_lag=MIN_LAG, max_lag=MAX_LAG, halo_only=True, conn=None):
+    """
+    Scores the alerts table against cme_events. Defaults to the range covered
+    by swis_moments, so CMEs whose arrival falls outside the data are not misses.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = psycopg2.connect(DB_URI)
+    try:
+        if not (start_date and end_date):
+            cursor = conn.cursor()
+            cursor.execute("SELECT MIN(observation_time), MAX(observation_time) FROM swis_moments")
+            min_date, max_date = cursor.fetchone()
+            cursor.close()
+            start_date, end_date = start_date or min_date, end_date or max_date
+        if start_date is None:
+            return None
+
+        event_starts, severities = load_alerts(conn, start_date, end_date)
+        cme_times = load_cmes(conn, start_date, end_date, halo_only, min_lag, max_lag)
+    finally:
+        if own_conn:
+            conn.close()
+
+    report = score(event_starts, cme_times, severities, min_lag, max_lag)
+    report['range'] = [str(start_date), str(end_date)]
+    report['halo_only'] = halo_only
+    return report
+
+def print_report(report):
+    if report is None:
+        print("No data in swis_moments to validate against.")
+        return
+    pct = lambda v: f"{v:.1%}" if v is not None else '-'
+    print(f"\n Validation {report['range'][0]} -> {report['range'][1]} "
+          f"(window {report['window_hours'][0]:g}h-{report['window_hours'][1]:g}h, "
+          f"{'halo CMEs' if report['halo_only'] else 'all CMEs'})")
+    print(f"  CMEs detected: {report['cmes_detected']}/{report['cmes']} ({pct(report['hit_rate'])})")
+    print(f"  False alarms:  {report['false_alarms']}/{report['events']} ({pct(report['false_alarm_ratio'])})")
+    lags = report['lag_hours']
+    if lags:
+        print(f"  Lag (h):       min {lags['min']:.1f} | p25 {lags['p25']:.1f} | median {lags['median']:.1f} | "
+              f"p75 {lags['p75']:.1f} | max {lags['max']:.1f}")
+    for level, counts in report.get('by_severity', {}).items():
+        print(f"  {level:<8} {counts['events']} events, {counts['false_alarms']} false alarms")
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Score the alerts table against the CACTus catalogue")
+    parser.add_argument("--start", type=str, default=None, help="Start of the validated range (default: first observation)")
+    parser.add_argument("--end", type=str, default=None, help="End of the validated range (default: last observation)")
+    parser.add_argument("--min-lag", type=float, default=MIN_LAG / pd.Timedelta(hours=1), help="Earliest arrival after CME onset, in hours")
+    parser.add_argument("--max-lag", type=float, default=MAX_LAG / pd.Timedelta(hours=1), help="Latest arrival after CME onset, in hours")
+    parser.add_argument("--all-cmes", action="store_true", help="Match against every CACTus CME, not only halo CMEs")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = validate(args.start, args.end, pd.Timedelta(hours=args.min_lag), pd.Timedelta(hours=args.max_lag),
+                      halo_only=not args.all_cmes)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
@@ -1,15 +1,28 @@
 from flask import Flask, render_template, jsonify, request, redirect, url_for, flash
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import check_password_hash, generate_password_hash
-import psycopg2
 import pandas as pd
 import numpy as np
 import tensorflow as tf
+import json
 import pickle
 import os
-import subprocess
+import sys
+import shutil
+import tempfile
 import threading
+import subprocess
+import queue
+from collections import namedtuple, deque
+from psycopg2 import errors as pg_errors
 from dotenv import load_dotenv
+from jobs import JobManager, JobCancelled, JobQueueFull
+from db import ConnectionPool, NotificationListener
+from user_cache import UserCache, watch_users
+from encoding import wants_columnar, columnar_response, epoch_ms, compress_response
+from revisions import RevisionTracker
+from forecast_cache import ForecastCache
+from inference import compile_forecast, compile_direct_forecast
 
 load_dotenv()
 
@@ -24,8 +37,22 @@ login_manager.login_view = 'login'
 # DATABASE CONFIGURATION
 DB_URI = os.getenv('DB_URI')
 
+# One pool per server process; connections are opened on first use
+db_pool = ConnectionPool(
+    DB_URI,
+    maxconn=int(os.getenv('DB_POOL_SIZE', 10)),
+    timeout=float(os.getenv('DB_POOL_TIMEOUT', 10))
+)
+
+# One LISTEN connection per server process, shared by the user cache and the data revisions
+notifications = NotificationListener(DB_URI)
+
 def get_db_connection():
-    return psycopg2.connect(DB_URI)
+    """Borrows a pooled connection: `with get_db_connection() as conn:`."""
+    return db_pool.connection()
+
+# gzip/brotli for large /api/ responses (see encoding.py)
+app.after_request(compress_response)
 
 # USER MODEL
 class User(UserMixin):
@@ -37,22 +64,35 @@ class User(UserMixin):
     def is_scientist(self):
         return self.role == 'scientist'
 
+# Users are cached per process; reset_users.py / update_users_db.py invalidate via NOTIFY
+user_cache = UserCache(
+    ttl=float(os.getenv('USER_CACHE_TTL', 300)),
+    max_size=int(os.getenv('USER_CACHE_SIZE', 1024))
+)
+watch_users(notifications, user_cache)
+
 @login_manager.user_loader
 def load_user(user_id):
+    notifications.ensure_running()
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT u.user_id, u.username, r.role_name 
-            FROM users u 
-            JOIN roles r ON u.role_id = r.role_id 
-            WHERE u.user_id = %s
-        """, (user_id,))
-        data = cur.fetchone()
-        conn.close()
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT u.user_id, u.username, r.role_name 
+                FROM users u 
+                JOIN roles r ON u.role_id = r.role_id 
+                WHERE u.user_id = %s
+            """, (user_id,))
+            data = cur.fetchone()
         
         if data:
-            return User(data[0], data[1], data[2])
+            user = User(data[0], data[1], data[2])
+            user_cache.put(user_id, user)
+            return user
     except Exception as e:
         print(f"DB Error loading user: {e}")
     return None
@@ -62,17 +102,202 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__fil
 CODE_DIR = os.path.join(BASE_DIR, 'code')
 MODEL_PATH = os.path.join(CODE_DIR, 'cme_prediction_model.keras')
 SCALER_PATH = os.path.join(CODE_DIR, 'scaler.pkl')
+METADATA_PATH = os.path.join(CODE_DIR, 'model_metadata.json')
+
+# Pipeline modules (feeder, scraper, training) are called in-process by background jobs
+sys.path.insert(0, CODE_DIR)
+import feeder
+import cactus_scraper
+import train_model
+import detection
+import validation
+import rollups
+
+# Data revisions behind the ETags of the read APIs (see revisions.py). The
+# watermark table and triggers are installed by the feeder (ensure_ingest_schema).
+data_revisions = RevisionTracker(notifications, channels=(feeder.NOTIFY_CHANNEL, feeder.REVISION_CHANNEL))
+
+class LoadedModel(namedtuple('LoadedModel', 'model scaler metadata forecast_fn version')):
+    """Everything /api/forecast needs from one trained model, published together."""
+    __slots__ = ()
+
+def model_files_signature():
+    """(size, mtime) of the model, scaler and metadata files; changes when train_model.py replaces them."""
+    signature = []
+    for path in (MODEL_PATH, SCALER_PATH, METADATA_PATH):
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_size, stat.st_mtime_ns))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+def load_ml_components():
+    """
+    Loads the model files into a new LoadedModel and publishes it with a single
+    assignment, so a request never sees a new model with an old scaler or
+    forecast function. If loading fails, the model already being served stays.
+    Each set of files is loaded once: callers that waited on the lock while
+    another request loaded the same files return without reloading.
+    """
+    global ml, ml_files
+    with ml_lock:
+        files = model_files_signature()
+        if files == ml_files:
+            return
+        # Attempted once per set of files, whether or not it loads
+        ml_files = files
+        print(f"Loading Model from: {MODEL_PATH}")
+        try:
+            model = tf.keras.models.load_model(MODEL_PATH)
+            with open(SCALER_PATH, 'rb') as f:
+                scaler = pickle.load(f)
+
+            # Models trained before train_model wrote metadata are single-step
+            metadata = {'mode': 'autoregressive', 'horizon': 1, 'lookback_hours': train_model.LOOKBACK_HOURS}
+            if os.path.exists(METADATA_PATH):
+                with open(METADATA_PATH) as f:
+                    metadata.update(json.load(f))
+
+            if metadata['mode'] == 'direct':
+                forecast_fn = compile_direct_forecast(model, scaler, metadata['lookback_hours'])
+            else:
+                forecast_fn = compile_forecast(model, scaler, metadata['lookback_hours'], FORECAST_STEPS)
+            if model_files_signature() != files:
+                # Training replaced files while they were read: the next request loads the finished set
+                ml_files = None
+                return
+            # The version is part of the forecast cache key: a reloaded model never serves old forecasts
+            version = ml.version + 1 if ml is not None else 1
+            ml = LoadedModel(model, scaler, metadata, forecast_fn, version)
+            print("Model & Scaler Loaded Successfully.")
+        except Exception as e:
+            print(f"Error loading ML components: {e}")
+
+# Hours an autoregressive (single-step) model is rolled forward for /api/forecast;
+# a direct model serves its own trained horizon
+FORECAST_STEPS = 6
 
-print(f"Loading Model from: {MODEL_PATH}")
-try:
-    model = tf.keras.models.load_model(MODEL_PATH)
-    with open(SCALER_PATH, 'rb') as f:
-        scaler = pickle.load(f)
-    print("Model & Scaler Loaded Successfully.")
-except Exception as e:
-    print(f"Error loading ML components: {e}")
-    model = None
-    scaler = None
+# The LoadedModel being served (None until one loads); replaced whole on reload
+ml = None
+ml_files = None
+ml_lock = threading.Lock()
+
+def current_model():
+    """
+    The LoadedModel to serve. Reloads first when the model files changed, so every
+    server process picks up a model trained by a job in another process or from
+    the command line.
+    """
+    if model_files_signature() != ml_files:
+        load_ml_components()
+    return ml
+
+# Forecasts per (model version, swis_moments revision, last observation time), see forecast_cache.py
+forecast_cache = ForecastCache(max_size=int(os.getenv('FORECAST_CACHE_SIZE', 32)))
+
+load_ml_components()
+
+# --- BACKGROUND JOBS ---
+# Bounded executor per process, job state in Postgres shared by all server processes (see jobs.py)
+jobs = JobManager(
+    get_db_connection,
+    max_workers=int(os.getenv('JOB_WORKERS', 1)),
+    max_pending=int(os.getenv('JOB_MAX_PENDING', 10))
+)
+UPLOAD_DIR = os.path.join(CODE_DIR, 'temp_ingest')
+
+def run_ingest_job(job, upload_dir):
+    """Ingests the uploaded CDF files through feeder, then removes the upload folder."""
+    try:
+        conn = feeder.get_db_connection()
+        try:
+            feeder.ensure_ingest_schema(conn)
+        finally:
+            conn.close()
+
+        paths = feeder.collect_cdf_files(upload_dir)
+        job.report(done=0, total=len(paths), message='Ingesting files')
+
+        def progress(done, total, stats, error):
+            outcome = error or stats.get('skipped') or f"{stats['added']} rows added"
+            job.report(done=done, total=total, message=f"{os.path.basename(stats['file'])}: {outcome}")
+
+        results = feeder.ingest_files(paths, bulk=True, progress=progress)
+        added = sum(r['added'] for r in results)
+        if added:
+            # Only the newly ingested rows are analyzed (see detection.run_incremental_analysis)
+            job.report(message='Running CME detection on new data')
+            detection.run_incremental_analysis()
+            if current_model() is not None:
+                # Warm the forecast cache so the next dashboard refresh does not wait on the model
+                job.report(message='Precomputing forecast')
+                try:
+                    latest_forecast()
+                except Exception as e:
+                    print(f"Forecast precompute failed: {e}")
+        return {
+            'files': len(results),
+            'rows': sum(r['rows'] for r in results),
+            'added': added
+        }
+    finally:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+def run_scrape_job(job):
+    def progress(done, total, label):
+        job.report(done=done, total=total, message=f"Scraped {label}")
+    return {'events': cactus_scraper.scrape_range(cactus_scraper.SCRAPE_YEARS, progress=progress)}
+
+TRAIN_SCRIPT = os.path.join(CODE_DIR, 'train_model.py')
+
+def run_training_job(job):
+    """
+    Trains in a child process (train_model.py --progress), so the fit neither
+    competes with requests for this process's GIL nor leaves its memory behind.
+    The child's PROGRESS lines are reported to the job; a cancel terminates it.
+    """
+    job.report(done=0, total=train_model.EPOCHS, message='Loading training data')
+    proc = subprocess.Popen([sys.executable, '-u', TRAIN_SCRIPT, '--progress'], cwd=CODE_DIR,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    lines = queue.Queue()
+
+    def forward_output():
+        for line in proc.stdout:
+            lines.put(line)
+        lines.put(None)
+    threading.Thread(target=forward_output, name='train-output', daemon=True).start()
+
+    output = deque(maxlen=20)
+    try:
+        while True:
+            try:
+                line = lines.get(timeout=1.0)
+            except queue.Empty:
+                job.report()  # Cancellation point while an epoch runs
+                continue
+            if line is None:
+                break
+            if line.startswith(train_model.PROGRESS_PREFIX):
+                progress = json.loads(line[len(train_model.PROGRESS_PREFIX):])
+                loss = progress.get('loss')
+                message = f"Epoch {progress['epoch']}" + (f", loss {loss:.5f}" if loss is not None else "")
+                job.report(done=progress['epoch'], total=progress['epochs'], message=message)
+            else:
+                print(line, end='')
+                output.append(line.strip())
+    except JobCancelled:
+        proc.terminate()
+        proc.wait()
+        raise
+
+    if proc.wait() != 0:
+        last = next((line for line in reversed(output) if line), None)
+        raise RuntimeError(last or f'Training exited with code {proc.returncode}')
+
+    # Serve the freshly trained model without restarting the app (a no-op if a request already loaded it)
+    current_model()
+    return {'model_path': MODEL_PATH}
 
 # --- ROUTES ---
 
@@ -92,16 +317,15 @@ def login():
         password = request.form['password']
         
         try:
-            conn = get_db_connection()
-            cur = conn.cursor()
-            # Check username OR email
-            cur.execute("""
-                SELECT user_id, username, password_hash 
-                FROM users 
-                WHERE username = %s OR email = %s
-            """, (login_id, login_id))
-            user_data = cur.fetchone()
-            conn.close()
+            with get_db_connection() as conn:
+                cur = conn.cursor()
+                # Check username OR email
+                cur.execute("""
+                    SELECT user_id, username, password_hash 
+                    FROM users 
+                    WHERE username = %s OR email = %s
+                """, (login_id, login_id))
+                user_data = cur.fetchone()
             
             if user_data and check_password_hash(user_data[2], password):
                 user_obj = load_user(user_data[0])
@@ -130,44 +354,41 @@ def signup():
         selected_role = request.form.get('role', 'viewer') # Default to viewer if missing
 
         try:
-            conn = get_db_connection()
-            cur = conn.cursor()
+            with get_db_connection() as conn:
+                cur = conn.cursor()
             
-            # Check if user exists
-            cur.execute("SELECT user_id FROM users WHERE username = %s OR email = %s", (username, email))
-            if cur.fetchone():
-                flash('Username or Email already registered.')
-                conn.close()
-                return redirect(url_for('signup'))
-
-            # Get role id dynamic
-            cur.execute("SELECT role_id FROM roles WHERE role_name = %s", (selected_role,))
-            role_res = cur.fetchone()
-            if not role_res:
-                flash(f'System error: Role "{selected_role}" not found.')
-                conn.close()
-                return redirect(url_for('signup'))
+                # Check if user exists
+                cur.execute("SELECT user_id FROM users WHERE username = %s OR email = %s", (username, email))
+                if cur.fetchone():
+                    flash('Username or Email already registered.')
+                    return redirect(url_for('signup'))
+
+                # Get role id dynamic
+                cur.execute("SELECT role_id FROM roles WHERE role_name = %s", (selected_role,))
+                role_res = cur.fetchone()
+                if not role_res:
+                    flash(f'System error: Role "{selected_role}" not found.')
+                    return redirect(url_for('signup'))
             
-            role_id = role_res[0]
-            password_hash = generate_password_hash(password)
-
-            # Insert User
-            cur.execute("""
-                INSERT INTO users (username, password_hash, email, full_name, role_id)
-                VALUES (%s, %s, %s, %s, %s)
-                RETURNING user_id;
-            """, (username, password_hash, email, full_name, role_id))
+                role_id = role_res[0]
+                password_hash = generate_password_hash(password)
+
+                # Insert User
+                cur.execute("""
+                    INSERT INTO users (username, password_hash, email, full_name, role_id)
+                    VALUES (%s, %s, %s, %s, %s)
+                    RETURNING user_id;
+                """, (username, password_hash, email, full_name, role_id))
             
-            new_user_id = cur.fetchone()[0]
+                new_user_id = cur.fetchone()[0]
 
-            # Log Creation Action
-            cur.execute("""
-                INSERT INTO action_logs (user_id, action_type, details)
-                VALUES (%s, 'ACCOUNT_CREATED', %s)
-            """, (new_user_id, f"User {username} signed up with email {email} as {selected_role.upper()}"))
+                # Log Creation Action
+                cur.execute("""
+                    INSERT INTO action_logs (user_id, action_type, details)
+                    VALUES (%s, 'ACCOUNT_CREATED', %s)
+                """, (new_user_id, f"User {username} signed up with email {email} as {selected_role.upper()}"))
 
-            conn.commit()
-            conn.close()
+                conn.commit()
             
             flash('Account initialized. Welcome to the network.')
             return redirect(url_for('login'))
@@ -190,131 +411,225 @@ def dashboard():
 
 # --- API ENDPOINTS ---
 
+TELEMETRY_COLUMNS = """observation_time, 
+               proton_speed, proton_density, proton_thermal_speed, alpha_density,
+               sc_x, sc_y, sc_z"""
+MAX_TELEMETRY_POINTS = 20000
+
+# Value columns of a telemetry response, besides 'time'
+TELEMETRY_SERIES = ('speed', 'density', 'temperature', 'alpha_ratio', 'bx', 'by', 'bz')
+
+# Min/max decimation: the span of data inside the requested range is cut into
+# equal time buckets and each bucket keeps its slowest and fastest sample
+# (real rows, so shock peaks survive), plus the latest sample so the
+# dashboard's current values stay exact. Only those rows leave the database.
+DOWNSAMPLED_TELEMETRY_QUERY = f"""
+    WITH bounds AS (
+        SELECT EXTRACT(EPOCH FROM MIN(observation_time)) AS lo,
+               EXTRACT(EPOCH FROM MAX(observation_time)) + 0.001 AS hi
+        FROM swis_moments
+        WHERE observation_time BETWEEN %(start)s AND %(end)s
+    ), ranged AS (
+        SELECT {TELEMETRY_COLUMNS},
+               width_bucket(EXTRACT(EPOCH FROM observation_time), bounds.lo, bounds.hi, %(buckets)s) AS bucket
+        FROM swis_moments, bounds
+        WHERE observation_time BETWEEN %(start)s AND %(end)s
+    ), ranked AS (
+        SELECT *,
+               ROW_NUMBER() OVER (PARTITION BY bucket ORDER BY proton_speed DESC, observation_time) AS peak_rank,
+               ROW_NUMBER() OVER (PARTITION BY bucket ORDER BY proton_speed ASC, observation_time) AS trough_rank,
+               ROW_NUMBER() OVER (ORDER BY observation_time DESC) AS recency
+        FROM ranged
+    )
+    SELECT {TELEMETRY_COLUMNS}
+    FROM ranked
+    WHERE peak_rank = 1 OR trough_rank = 1 OR recency = 1
+    ORDER BY observation_time ASC;
+"""
+
+LATEST_TELEMETRY_QUERY = f"""
+    SELECT {TELEMETRY_COLUMNS}
+    FROM swis_moments
+    WHERE observation_time BETWEEN %s AND %s
+    ORDER BY observation_time DESC
+    LIMIT 1;
+"""
+
+def rollup_telemetry(conn, start_date, end_date, buckets):
+    """
+    Long ranges: the same min/max decimation, read from the rollup tables
+    (see rollups.py). Each bucket yields its slowest and fastest speed at the
+    rollup time where they occurred, with the bucket means of the other
+    columns. Returns None when the range is too short for rollups.
+    """
+    series, _ = rollups.fetch_series(conn, start_date, end_date, buckets)
+    if series is None or series.empty:
+        return series
+
+    parts = []
+    for extreme in ('min', 'max'):
+        parts.append(pd.DataFrame({
+            'observation_time': series[f'proton_speed_{extreme}_time'],
+            'proton_speed': series[f'proton_speed_{extreme}'],
+            **{col: series[f'{col}_mean'] for col in ('proton_density', 'proton_thermal_speed', 'alpha_density',
+                                                      'sc_x', 'sc_y', 'sc_z')}
+        }))
+    df = pd.concat(parts).sort_values(['observation_time', 'proton_speed'])
+    df = df.drop_duplicates('observation_time', keep='last')
+
+    # Keep the latest raw sample so the dashboard's current values stay exact
+    latest = pd.read_sql(LATEST_TELEMETRY_QUERY, conn, params=(start_date, end_date))
+    return pd.concat([df, latest], ignore_index=True).sort_values('observation_time', ignore_index=True)
+
 @app.route('/api/telemetry')
 @login_required
+@data_revisions.conditional('swis_moments')
 def get_telemetry():
     # Limit default range for faster initial load
     start_date = request.args.get('start', '2024-05-10')
     end_date = request.args.get('end', '2024-10-15')
+    points = request.args.get('points', type=int)
     
-    conn = get_db_connection()
-    # Downsample for big ranges using modulo if needed, but LIMIT is safer for now
-    query = """
-        SELECT observation_time, 
-               proton_speed, proton_density, proton_thermal_speed, alpha_density,
-               sc_x, sc_y, sc_z
-        FROM swis_moments 
-        WHERE observation_time BETWEEN %s AND %s
-        ORDER BY observation_time ASC
-        LIMIT 5000;
-    """
-    df = pd.read_sql(query, conn, params=(start_date, end_date))
-    conn.close()
+    if points:
+        # Downsample the whole range to about `points` samples
+        try:
+            if pd.Timestamp(end_date) <= pd.Timestamp(start_date):
+                return jsonify({'error': 'end must be after start'}), 400
+        except ValueError:
+            return jsonify({'error': 'Invalid start or end'}), 400
+        points = min(max(points, 2), MAX_TELEMETRY_POINTS)
+        with get_db_connection() as conn:
+            try:
+                df = rollup_telemetry(conn, start_date, end_date, points // 2)
+            except pg_errors.UndefinedTable:
+                # Rollups not built yet (feeder creates them on its next run)
+                conn.rollback()
+                df = None
+            if df is None:
+                df = pd.read_sql(DOWNSAMPLED_TELEMETRY_QUERY, conn,
+                                 params={'start': start_date, 'end': end_date, 'buckets': points // 2})
+    else:
+        # Raw rows: only the beginning of long ranges fits in the limit
+        query = f"""
+            SELECT {TELEMETRY_COLUMNS}
+            FROM swis_moments 
+            WHERE observation_time BETWEEN %s AND %s
+            ORDER BY observation_time ASC
+            LIMIT 5000;
+        """
+        with get_db_connection() as conn:
+            df = pd.read_sql(query, conn, params=(start_date, end_date))
     
+    columnar = wants_columnar()
     if df.empty:
+        if columnar:
+            return columnar_response({'time': np.empty(0, np.int64), **{name: np.empty(0) for name in TELEMETRY_SERIES}})
         return jsonify({'time': [], 'speed': [], 'density': [], 'temperature': [], 'alpha_ratio': [], 'bx': [], 'by': [], 'bz': []})
 
     # Calculate Ratio
     df['alpha_ratio'] = (df['alpha_density'] / df['proton_density'].replace(0, np.nan)) * 100
     
+    series = {
+        'speed': df['proton_speed'],
+        'density': df['proton_density'],
+        'temperature': df['proton_thermal_speed'],
+        'alpha_ratio': df['alpha_ratio'].fillna(0),
+        'bx': df['sc_x'].fillna(0),
+        'by': df['sc_y'].fillna(0),
+        'bz': df['sc_z'].fillna(0)
+    }
+    if columnar:
+        # Typed arrays straight from the DataFrame, no per-value conversion
+        return columnar_response({'time': epoch_ms(df['observation_time']), **series})
+
     return jsonify({
         'time': df['observation_time'].astype(str).tolist(),
-        'speed': df['proton_speed'].tolist(),
-        'density': df['proton_density'].tolist(),
-        'temperature': df['proton_thermal_speed'].tolist(),
-        'alpha_ratio': df['alpha_ratio'].fillna(0).tolist(),
-        'bx': df['sc_x'].fillna(0).tolist(),
-        'by': df['sc_y'].fillna(0).tolist(),
-        'bz': df['sc_z'].fillna(0).tolist()
+        **{name: values.tolist() for name, values in series.items()}
     })
 
-    # Calculate Ratio
-    df['alpha_ratio'] = (df['alpha_density'] / df['proton_density'].replace(0, np.nan)) * 100
+FORECAST_INPUT_QUERY = """
+    SELECT proton_speed, proton_density, proton_thermal_speed, alpha_density, observation_time
+    FROM swis_moments
+    ORDER BY observation_time DESC
+    LIMIT %s;
+"""
+
+def run_forecast(last_24h, forecast_fn, mode):
+    """Hourly speed forecast from a chronological (lookback, 4) window."""
+    # --- PROGNOSTIC LOOP (6 hours rolled forward, or a direct model's horizon), compiled in inference.py ---
+    speeds = forecast_fn(last_24h.values)
+    last_known_time = last_24h.index[-1]
+    forecasts = [{
+        'time': (last_known_time + pd.Timedelta(hours=i + 1)).isoformat(),
+        'speed': float(speed)
+    } for i, speed in enumerate(speeds)]
+
+    return {
+        "predictions": forecasts,
+        "last_observed_time": last_known_time.isoformat(),
+        "mode": mode
+    }
+
+def latest_forecast():
+    """
+    Forecast from the newest `lookback_hours` rows (from the model metadata),
+    computed once per (model version, swis_moments revision, last observation
+    time) and shared through forecast_cache. None without enough data.
+    """
+    current = current_model()
+    if current is None:
+        return None
+
+    # The model's input window of most recent rows for prediction context
+    lookback = current.metadata['lookback_hours']
+    with get_db_connection() as conn:
+        # Read before the rows: a re-ingest that keeps the same last timestamp
+        # (e.g. a V02 replacing a V01) still moves the revision
+        cur = conn.cursor()
+        cur.execute("SELECT revision FROM ingest_watermark WHERE source = %s", (feeder.WATERMARK_SOURCE,))
+        row = cur.fetchone()
+        revision = row[0] if row else None
+        df = pd.read_sql(FORECAST_INPUT_QUERY, conn, params=(lookback,))
     
-    return jsonify({
-        'time': df['observation_time'].astype(str).tolist(),
-        'speed': df['proton_speed'].tolist(),
-        'density': df['proton_density'].tolist(),
-        'temperature': df['proton_temperature'].tolist(),
-        'alpha_ratio': df['alpha_ratio'].fillna(0).tolist()
-    })
+    if len(df) < lookback:
+        return None
+    
+    # Sort correctly as input needs to be chronological
+    last_24h = df.sort_values('observation_time').set_index('observation_time')
+    key = (current.version, revision, last_24h.index[-1])
+    return forecast_cache.get_or_compute(
+        key, lambda: run_forecast(last_24h, current.forecast_fn, current.metadata['mode']))
 
 @app.route('/api/forecast')
 @login_required
 def get_forecast():
-    if model is None:
+    if current_model() is None:
         return jsonify({'error': 'Model not loaded'})
         
-    conn = get_db_connection()
-    # Get last 24h of data for prediction context
-    query = """
-        SELECT proton_speed, proton_density, proton_thermal_speed, alpha_density, observation_time
-        FROM swis_moments
-        ORDER BY observation_time DESC
-        LIMIT 24;
-    """
-    df = pd.read_sql(query, conn)
-    conn.close()
-    
-    if len(df) < 24:
+    result = latest_forecast()
+    if result is None:
         return jsonify({'error': 'Insufficient data for prediction'})
-    
-    # Sort correctly as input needs to be chronological
-    last_24h = df.sort_values('observation_time').set_index('observation_time')
-    
-    # --- PROGNOSTIC LOOP (Generate 6 Hours of Forecast) ---
-    forecasts = []
-    current_input_seq = last_24h.values # Shape (24, 4)
-    last_known_time = last_24h.index[-1]
-    
-    for i in range(6):
-        # Scale Input
-        input_scaled = scaler.transform(current_input_seq)
-        input_reshaped = input_scaled.reshape(1, 24, 4)
-        
-        # Predict Next Step
-        prediction_scaled = model.predict(input_reshaped, verbose=0)
-        predicted_speed = prediction_scaled[0][0] # Scaled result
-        
-        # Inverse Transform (using dummy array since scaler expects 4 features)
-        dummy_row = np.zeros((1, 4))
-        dummy_row[0, 0] = predicted_speed
-        
-        # For the next input step, we need to append this prediction.
-        # However, our model is multivariate (4 features) but we only predict Speed.
-        # A simple autoregressive strategy is to repeat the last known values for other features
-        # or assume they stay constant. For this demo, we'll keep last known values constant.
-        
-        predicted_actual_speed = scaler.inverse_transform(dummy_row)[0][0]
-        
-        future_time = last_known_time + pd.Timedelta(hours=i+1)
-        forecasts.append({
-            'time': future_time.isoformat(),
-            'speed': float(predicted_actual_speed)
-        })
-        
-        # Update Sequence for next iteration:
-        # 1. Shift array left
-        # 2. Append new row [pred_speed, last_density, last_temp, last_alpha]
-        new_row = current_input_seq[-1].copy()
-        new_row[0] = predicted_actual_speed # Update speed with prediction
-        
-        current_input_seq = np.vstack([current_input_seq[1:], new_row])
 
-    return jsonify({
-        "predictions": forecasts,
-        "last_observed_time": last_known_time.isoformat()
-    })
+    if wants_columnar():
+        forecasts = result['predictions']
+        return columnar_response(
+            {'time': epoch_ms(pd.to_datetime([f['time'] for f in forecasts])),
+             'speed': np.array([f['speed'] for f in forecasts])},
+            meta={'last_observed_time': int(epoch_ms([pd.Timestamp(result['last_observed_time'])])[0]),
+                  'mode': result['mode']}
+        )
+
+    return jsonify(result)
 
 @app.route('/api/system-status')
+@data_revisions.conditional('swis_moments')
 def get_system_status():
     """Returns the latest available data timestamp to anchor the dashboard."""
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT MAX(observation_time) FROM swis_moments;")
-        latest = cur.fetchone()[0]
-        conn.close()
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT MAX(observation_time) FROM swis_moments;")
+            latest = cur.fetchone()[0]
         
         if latest:
             return jsonify({'status': 'online', 'latest_data_time': latest.isoformat()})
@@ -324,19 +639,19 @@ def get_system_status():
 
 @app.route('/api/alerts')
 @login_required
+@data_revisions.conditional('alerts')
 def get_alerts():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    # Get total count
-    cur.execute("SELECT COUNT(*) FROM alerts")
-    total_count = cur.fetchone()[0]
-    
-    # Get recent
-    cur.execute("SELECT generated_at, severity, message FROM alerts ORDER BY generated_at DESC LIMIT 10")
-    alerts = [{'generated_at': r[0], 'severity': r[1], 'message': r[2]} for r in cur.fetchall()]
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        
+        # Get total count
+        cur.execute("SELECT COUNT(*) FROM alerts")
+        total_count = cur.fetchone()[0]
+        
+        # Get recent
+        cur.execute("SELECT generated_at, severity, message FROM alerts ORDER BY generated_at DESC LIMIT 10")
+        alerts = [{'generated_at': r[0], 'severity': r[1], 'message': r[2]} for r in cur.fetchall()]
     
-    conn.close()
     return jsonify({
         'total': total_count,
         'recent': alerts
@@ -344,6 +659,7 @@ def get_alerts():
 
 @app.route('/api/cme-history')
 @login_required
+@data_revisions.conditional('cme_events', key=lambda: current_user.role)
 def get_cme_history():
     if not current_user.is_scientist():
         return jsonify({'error': 'Unauthorized'}), 403
@@ -351,9 +667,6 @@ def get_cme_history():
     start = request.args.get('start')
     end = request.args.get('end')
     
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
     # Corrected columns based on schema
     query = "SELECT event_id, start_time, velocity, angular_width, is_halo FROM cme_events"
     params = []
@@ -364,22 +677,50 @@ def get_cme_history():
         
     query += " ORDER BY start_time DESC LIMIT 100"
     
-    try:
-        cur.execute(query, tuple(params))
-        events = [{
-            'id': r[0], 
-            'start': r[1], 
-            'source': f"{r[3]}°", # Mapping ang_width to source/desc since source isn't there
-            'type': 'Halo' if r[4] else 'Normal', 
-            'note': f"V: {r[2]} km/s"
-        } for r in cur.fetchall()]
-    except Exception as e:
-        print(f"CME History Error: {e}")
-        events = []
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(query, tuple(params))
+            events = [{
+                'id': r[0], 
+                'start': r[1], 
+                'source': f"{r[3]}°", # Mapping ang_width to source/desc since source isn't there
+                'type': 'Halo' if r[4] else 'Normal', 
+                'note': f"V: {r[2]} km/s"
+            } for r in cur.fetchall()]
+        except Exception as e:
+            print(f"CME History Error: {e}")
+            events = []
     
-    conn.close()
     return jsonify(events)
 
+@app.route('/api/validation')
+@login_required
+def get_validation():
+    """Scores the current alerts against the CACTus catalogue (see validation.py)."""
+    if not current_user.is_scientist():
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    try:
+        min_lag = pd.Timedelta(hours=float(request.args.get('min_lag', validation.MIN_LAG / pd.Timedelta(hours=1))))
+        max_lag = pd.Timedelta(hours=float(request.args.get('max_lag', validation.MAX_LAG / pd.Timedelta(hours=1))))
+    except ValueError:
+        return jsonify({'error': 'min_lag and max_lag must be numbers of hours'}), 400
+    if min_lag > max_lag:
+        return jsonify({'error': 'min_lag must not exceed max_lag'}), 400
+
+    try:
+        with get_db_connection() as conn:
+            report = validation.validate(request.args.get('start'), request.args.get('end'), min_lag, max_lag,
+                                         halo_only=request.args.get('all_cmes') != 'true', conn=conn)
+    except Exception as e:
+        print(f"Validation Error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+    if report is None:
+        return jsonify({'error': 'No telemetry to validate against'}), 404
+    return jsonify(report)
+
 # --- SCIENTIST ONLY ROUTES ---
 
 @app.route('/api/submit-feedback', methods=['POST'])
@@ -390,21 +731,20 @@ def submit_feedback():
         
     data = request.json
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO model_feedback (user_id, observation_time, ai_predicted_speed, human_corrected_speed, comments)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (current_user.id, data['time'], data['predicted'], data['corrected'], data.get('comment', '')))
-        
-        # Log action
-        cur.execute("""
-            INSERT INTO action_logs (user_id, action_type, details)
-            VALUES (%s, 'CORRECT_PREDICTION', %s)
-        """, (current_user.id, f"Correction: {data['predicted']} -> {data['corrected']}"))
-        
-        conn.commit()
-        conn.close()
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO model_feedback (user_id, observation_time, ai_predicted_speed, human_corrected_speed, comments)
+                VALUES (%s, %s, %s, %s, %s)
+            """, (current_user.id, data['time'], data['predicted'], data['corrected'], data.get('comment', '')))
+            
+            # Log action
+            cur.execute("""
+                INSERT INTO action_logs (user_id, action_type, details)
+                VALUES (%s, 'CORRECT_PREDICTION', %s)
+            """, (current_user.id, f"Correction: {data['predicted']} -> {data['corrected']}"))
+            
+            conn.commit()
         return jsonify({'status': 'success'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -417,44 +757,29 @@ def ingest_data():
 
     mode = request.form.get('mode') # 'file' or 'scrape'
     
-    if mode == 'file':
-        files = request.files.getlist('files')
-        if not files: return jsonify({'error': 'No files uploaded'}), 400
-        
-        # Save to temp dir
-        temp_dir = os.path.join(CODE_DIR, 'temp_ingest')
-        os.makedirs(temp_dir, exist_ok=True)
-        
-        for f in files:
-            if f.filename.endswith('.cdf'):
-                f.save(os.path.join(temp_dir, f.filename))
-        
-        # Run feeder on temp dir
-        # We start a thread to run the script
-        def run_feeder():
-            script_path = os.path.join(CODE_DIR, 'feeder.py')
-            subprocess.run(['python', script_path, '--dir', temp_dir], capture_output=True)
-            # Cleanup
-            for f in os.listdir(temp_dir):
-                os.remove(os.path.join(temp_dir, f))
-            os.rmdir(temp_dir)
+    try:
+        if mode == 'file':
+            files = request.files.getlist('files')
+            if not files: return jsonify({'error': 'No files uploaded'}), 400
             
-        thread = threading.Thread(target=run_feeder)
-        thread.start()
-        
-        return jsonify({'status': 'started', 'message': f'Ingesting {len(files)} files...'})
-
-    elif mode == 'scrape':
-        days = request.form.get('days', 7)
-        # Assuming scraper script has args, or we just run it. 
-        # Current scraper seems to do "latest". We'll just run it.
-        def run_scraper():
-            script_path = os.path.join(CODE_DIR, 'cactus_scraper.py')
-            subprocess.run(['python', script_path], capture_output=True)
+            # Each upload gets its own folder so concurrent jobs never share files
+            os.makedirs(UPLOAD_DIR, exist_ok=True)
+            upload_dir = tempfile.mkdtemp(dir=UPLOAD_DIR)
+            
+            for f in files:
+                if f.filename.endswith('.cdf'):
+                    f.save(os.path.join(upload_dir, os.path.basename(f.filename)))
             
-        thread = threading.Thread(target=run_scraper)
-        thread.start()
-        return jsonify({'status': 'started', 'message': 'Scraper started...'})
+            job = jobs.submit('ingest', run_ingest_job, upload_dir, owner=current_user.id,
+                              description=f'Ingest {len(files)} uploaded files')
+            return jsonify({'status': 'started', 'job_id': job['id'], 'message': f'Ingesting {len(files)} files...'})
+
+        elif mode == 'scrape':
+            job = jobs.submit('scrape', run_scrape_job, owner=current_user.id,
+                              description='CACTus catalog scrape', dedupe=True)
+            return jsonify({'status': 'started', 'job_id': job['id'], 'message': 'Scraper started...'})
+    except JobQueueFull as e:
+        return jsonify({'error': f'Job queue is full: {e}'}), 429
         
     return jsonify({'error': 'Invalid mode'}), 400
 
@@ -466,23 +791,47 @@ def run_script():
         
     script_name = request.json.get('script')
     allowed_scripts = {
-        'train': 'train_model.py'
+        'train': run_training_job
     }
     
     if script_name not in allowed_scripts:
         return jsonify({'error': 'Invalid script'}), 400
         
-    script_path = os.path.join(CODE_DIR, allowed_scripts[script_name])
-    
-    def run_process():
-        # In production this would use proper task queues like Celery
-        subprocess.run(['python', script_path], capture_output=True)
-        
-    # Run in background to not block UI
-    thread = threading.Thread(target=run_process)
-    thread.start()
+    # Run in background to not block UI; a second click joins the active job
+    try:
+        job = jobs.submit(script_name, allowed_scripts[script_name], owner=current_user.id,
+                          description=f'Run {script_name}', dedupe=True)
+    except JobQueueFull as e:
+        return jsonify({'error': f'Job queue is full: {e}'}), 429
     
-    return jsonify({'status': 'started', 'message': f'{script_name} started in background'})
+    return jsonify({'status': 'started', 'job_id': job['id'], 'message': f'{script_name} started in background'})
+
+@app.route('/api/jobs')
+@login_required
+def list_jobs():
+    if not current_user.is_scientist():
+        return jsonify({'error': 'Unauthorized'}), 403
+    return jsonify(jobs.list())
+
+@app.route('/api/jobs/<job_id>')
+@login_required
+def get_job(job_id):
+    if not current_user.is_scientist():
+        return jsonify({'error': 'Unauthorized'}), 403
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_job(job_id):
+    if not current_user.is_scientist():
+        return jsonify({'error': 'Unauthorized'}), 403
+    job = jobs.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
 
 
 if __name__ == '__main__':
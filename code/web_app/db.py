@@ -0,0 +1,192 @@
+import os
+import time
+import select
+import threading
+from contextlib import contextmanager
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+
+# Process-wide Postgres connection pool for the web app.
+# Handlers borrow a connection with `with pool.connection() as conn:` instead
+# of paying a connect (TLS + auth) on every request.
+#
+# The pool is created lazily in the process that first uses it. Forking
+# servers (e.g. gunicorn workers) therefore each build their own pool, and a
+# pool inherited across a fork is abandoned rather than closed, since closing
+# it would end the parent's sessions.
+
+class ConnectionPool:
+    """
+    Thread-safe pool of at most `maxconn` connections. Checkout blocks up to
+    `timeout` seconds when all are in use. A connection idle for more than
+    `check_after` seconds is pinged before it is handed out, and replaced if
+    the server dropped it.
+    """
+
+    def __init__(self, dsn, minconn=1, maxconn=10, timeout=10.0, check_after=30.0):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_after = check_after
+        self._pool = None
+        self._pid = None
+        self._slots = None
+        self._last_used = {}
+        self._abandoned = []
+        self._lock = threading.Lock()
+
+    def _ensure_pool(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pool is not None:
+                # Inherited from the parent process: keep the sockets referenced, never use them
+                self._abandoned.append(self._pool)
+            self._pool = ThreadedConnectionPool(self.minconn, self.maxconn, self.dsn)
+            self._slots = threading.BoundedSemaphore(self.maxconn)
+            self._last_used = {}
+            self._pid = os.getpid()
+
+    def _healthy(self, conn):
+        if conn.closed:
+            return False
+        if time.monotonic() - self._last_used.get(id(conn), 0) < self.check_after:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    def getconn(self):
+        self._ensure_pool()
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolError(f"No database connection available within {self.timeout}s (pool size {self.maxconn})")
+        try:
+            # Every idle connection may have been dropped (e.g. after a server restart)
+            for _ in range(self.maxconn + 1):
+                conn = self._pool.getconn()
+                if self._healthy(conn):
+                    return conn
+                self._last_used.pop(id(conn), None)
+                self._pool.putconn(conn, close=True)
+            raise PoolError("Could not get a working database connection")
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn):
+        """Returns a connection; an open transaction is rolled back, a broken connection is dropped."""
+        try:
+            broken = bool(conn.closed)
+            if not broken and conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                    broken = True
+            self._last_used.pop(id(conn), None)
+            if not broken:
+                self._last_used[id(conn)] = time.monotonic()
+            self._pool.putconn(conn, close=broken)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Borrows a connection for a `with` block. Callers still commit their own writes."""
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def closeall(self):
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.closeall()
+            self._pool = None
+            self._pid = None
+
+# Shared LISTEN connection for the web app.
+# Components that react to NOTIFY (the user cache, the data revisions)
+# subscribe to one NotificationListener, so each server process holds a single
+# listening connection whatever the number of channels. Like the pool, its
+# thread is started lazily in the process that first needs it.
+
+class NotificationListener:
+    """
+    LISTENs on every subscribed channel in a daemon thread and hands each
+    notification to the subscribers of its channel. Subscribers also hear when
+    the connection is (re)established and when it is lost, since notifications
+    sent in between are never delivered. Subscribe before ensure_running().
+    """
+
+    def __init__(self, dsn, retry_delay=5.0):
+        self.dsn = dsn
+        self.retry_delay = retry_delay
+        self._subscribers = []
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels, on_notify, on_connect=None, on_disconnect=None):
+        """
+        on_notify(conn, notifies) gets the pending notifications of `channels`
+        in one list; on_connect(conn) runs after LISTEN, and on_disconnect()
+        when the connection is lost or the process starts listening afresh.
+        """
+        self._subscribers.append((tuple(channels), on_notify, on_connect, on_disconnect))
+
+    def ensure_running(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # State inherited across a fork is not kept up to date here
+            self._disconnected()
+            threading.Thread(target=self._run, name='notification-listener', daemon=True).start()
+            self._pid = os.getpid()
+
+    def _disconnected(self):
+        for _, _, _, on_disconnect in self._subscribers:
+            if on_disconnect:
+                on_disconnect()
+
+    def _run(self):
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn)
+                conn.autocommit = True
+                cursor = conn.cursor()
+                for channel in sorted({channel for channels, *_ in self._subscribers for channel in channels}):
+                    cursor.execute(f"LISTEN {channel};")
+                # Subscribers read only after LISTEN, so no change can fall in between
+                for _, _, on_connect, _ in self._subscribers:
+                    if on_connect:
+                        on_connect(conn)
+
+                while True:
+                    if select.select([conn], [], [], 60.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    notifies = list(conn.notifies)
+                    conn.notifies.clear()
+                    for channels, on_notify, _, _ in self._subscribers:
+                        matching = [notify for notify in notifies if notify.channel in channels]
+                        if matching:
+                            on_notify(conn, matching)
+            except Exception as e:
+                print(f"Notification listener error: {e}")
+            finally:
+                self._disconnected()
+                if conn is not None:
+                    conn.close()
+            time.sleep(self.retry_delay)
@@ -0,0 +1,88 @@
+import gzip
+import json
+import numpy as np
+from flask import request, Response
+
+try:
+    import brotli
+except ImportError:  # Optional: without it responses are only gzip-compressed
+    brotli = None
+
+# Response encodings for the read APIs.
+#
+# Columnar payload (COLUMNAR_MIMETYPE, chosen with an Accept header; JSON stays
+# the default). All numbers are little-endian:
+#   4 bytes   magic b'CMEC'
+#   4 bytes   uint32 length of the JSON header
+#   header    {"rows": n, "columns": [{"name", "dtype", "offset"}, ...], "meta": {...}},
+#             space-padded so the column data starts on an 8-byte boundary
+#   columns   back to back, each padded to 8 bytes; `offset` counts from the
+#             end of the header. dtype is "int64" (times, epoch milliseconds)
+#             or "float32" (everything else)
+# A browser reads each column as a typed array over the response buffer.
+
+COLUMNAR_MIMETYPE = 'application/vnd.cme.columns'
+COLUMNAR_MAGIC = b'CMEC'
+
+# Smaller bodies are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+def _pad(length, alignment=8):
+    return -length % alignment
+
+def encode_columns(columns, meta=None):
+    """Packs a dict of equal-length arrays into one columnar payload."""
+    rows = len(next(iter(columns.values()))) if columns else 0
+    descriptors, buffers, offset = [], [], 0
+    for name, values in columns.items():
+        values = np.asarray(values)
+        if values.dtype.kind in 'iuM':
+            data, dtype = values.astype('<i8'), 'int64'
+        else:
+            data, dtype = values.astype('<f4'), 'float32'
+        if len(data) != rows:
+            raise ValueError(f"Column {name} has {len(data)} rows, expected {rows}")
+        raw = data.tobytes()
+        descriptors.append({'name': name, 'dtype': dtype, 'offset': offset})
+        buffers.append(raw + b'\0' * _pad(len(raw)))
+        offset += len(buffers[-1])
+
+    header = json.dumps({'rows': rows, 'columns': descriptors, 'meta': meta or {}}).encode()
+    header += b' ' * _pad(8 + len(header))
+    return COLUMNAR_MAGIC + len(header).to_bytes(4, 'little') + header + b''.join(buffers)
+
+def wants_columnar():
+    """True when the client prefers the columnar payload over JSON."""
+    best = request.accept_mimetypes.best_match(['application/json', COLUMNAR_MIMETYPE])
+    return best == COLUMNAR_MIMETYPE
+
+def columnar_response(columns, meta=None):
+    response = Response(encode_columns(columns, meta), mimetype=COLUMNAR_MIMETYPE)
+    response.vary.add('Accept')
+    return response
+
+def epoch_ms(times):
+    """datetime64 values (Series or array) -> int64 milliseconds since 1970."""
+    return np.asarray(times, dtype='datetime64[ms]').astype(np.int64)
+
+def compress_response(response):
+    """
+    after_request hook: brotli- or gzip-encodes large API responses when the
+    client accepts it (brotli preferred when the module is installed).
+    """
+    if (response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers or not request.path.startswith('/api/')):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < MIN_COMPRESS_SIZE:
+        return response
+
+    if brotli is not None and request.accept_encodings['br']:
+        response.set_data(brotli.compress(body, quality=5))
+        response.headers['Content-Encoding'] = 'br'
+    elif request.accept_encodings['gzip']:
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
@@ -0,0 +1,56 @@
+import threading
+from collections import OrderedDict
+
+# In-process cache of /api/forecast results.
+#
+# A forecast only depends on the model and on the last observed rows, so it is
+# keyed by (model version, swis_moments revision, last observation time) and
+# recomputed only when data is loaded or the model is retrained. The revision
+# covers re-ingests that rewrite rows without moving the last timestamp. Concurrent requests for a key
+# that is still being computed wait for that one computation instead of each
+# running the model.
+
+class ForecastCache:
+    """Thread-safe LRU of at most `max_size` results, with one computation per key."""
+
+    def __init__(self, max_size=32):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # key -> result
+        self._pending = {}             # key -> Event set when its computation ends
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the cached result for `key`, or compute() it once. A failing
+        compute() is not cached; waiters then retry it themselves.
+        """
+        while True:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    return self._entries[key]
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = threading.Event()
+                    break
+            pending.wait()
+
+        try:
+            result = compute()
+            with self._lock:
+                self._entries[key] = result
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+            return result
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.set()
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
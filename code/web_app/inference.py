@@ -0,0 +1,66 @@
+import numpy as np
+import tensorflow as tf
+
+# Compiled autoregressive forecast.
+#
+# The 6-hour forecast feeds each predicted speed back into the 24-hour input
+# window, holding density, thermal speed and alpha density at their last known
+# values. Running that recurrence as six model.predict() calls pays predict's
+# per-call setup every step. Here the whole recurrence, including the
+# MinMaxScaler transforms, is one tf.function traced once per model.
+#
+# A direct multi-horizon model (see train_model.py) needs no recurrence: one
+# forward pass yields every hour of its horizon.
+#
+# The arithmetic mirrors the original loop exactly: scaling and unscaling run
+# in float64 in the same order as sklearn (X * scale_ + min_, then
+# (y - min_) / scale_), and only the model input is cast to float32, so the
+# results are identical.
+
+def compile_forecast(model, scaler, lookback, steps):
+    """
+    Returns forecast(window) -> `steps` predicted speeds (km/s, float64) for
+    a chronological (lookback, n_features) window of unscaled values.
+    """
+    scale = tf.constant(scaler.scale_, dtype=tf.float64)
+    offset = tf.constant(scaler.min_, dtype=tf.float64)
+
+    @tf.function(input_signature=[tf.TensorSpec([lookback, len(scaler.scale_)], tf.float64)])
+    def rollout(window):
+        speeds = []
+        for _ in range(steps):
+            scaled = window * scale + offset
+            predicted_scaled = model(tf.cast(scaled, tf.float32)[tf.newaxis], training=False)[0, 0]
+            speed = (tf.cast(predicted_scaled, tf.float64) - offset[0]) / scale[0]
+            speeds.append(speed)
+
+            # Next window: drop the oldest row, append [speed, last density, last temp, last alpha]
+            new_row = tf.concat([speed[tf.newaxis], window[-1, 1:]], axis=0)
+            window = tf.concat([window[1:], new_row[tf.newaxis]], axis=0)
+        return tf.stack(speeds)
+
+    return _traced(rollout, lookback, len(scaler.scale_))
+
+def compile_direct_forecast(model, scaler, lookback):
+    """
+    Same interface for a direct multi-horizon model (train_model --direct-horizon):
+    one forward pass returns every hour of the horizon, with no feedback.
+    """
+    scale = tf.constant(scaler.scale_, dtype=tf.float64)
+    offset = tf.constant(scaler.min_, dtype=tf.float64)
+
+    @tf.function(input_signature=[tf.TensorSpec([lookback, len(scaler.scale_)], tf.float64)])
+    def predict_horizon(window):
+        scaled = window * scale + offset
+        predicted_scaled = model(tf.cast(scaled, tf.float32)[tf.newaxis], training=False)[0]
+        return (tf.cast(predicted_scaled, tf.float64) - offset[0]) / scale[0]
+
+    return _traced(predict_horizon, lookback, len(scaler.scale_))
+
+def _traced(graph_fn, lookback, n_features):
+    def forecast(window):
+        return graph_fn(tf.constant(np.asarray(window, dtype=np.float64))).numpy()
+
+    # Trace now so the first request does not pay for it
+    forecast(np.zeros((lookback, n_features)))
+    return forecast
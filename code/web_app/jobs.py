@@ -0,0 +1,259 @@
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.extras import Json
+
+# Background jobs for the web app (ingestion, scraping, training).
+# Jobs run on a small fixed thread pool in the server process that accepted
+# them, so concurrent requests queue up instead of each starting its own
+# interpreter. Their state lives in the background_jobs table (created by
+# setup_auth.py), so with several server processes any of them can report on
+# or cancel any job, and the queue limit and dedupe apply to all of them.
+#
+# A heartbeat thread per process touches the rows of its own jobs and picks up
+# cancel requests made through other processes. An active job whose heartbeat
+# has stopped belonged to a process that died; it is marked failed.
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+# Serializes the queue-limit / dedupe check and the insert across processes
+JOBS_LOCK_ID = 7200801
+
+JOB_COLUMNS = """
+    job_id, kind, description, status, cancel_requested, progress, result, error,
+    created_at, started_at, finished_at
+"""
+
+class JobCancelled(Exception):
+    """Raised inside a running job once a cancel has been requested."""
+
+class JobQueueFull(Exception):
+    """Raised when too many jobs are already queued or running."""
+
+class Job:
+    """Handle of a job running in this process, passed to the job function."""
+
+    def __init__(self, manager, job_id, kind):
+        self.id = job_id
+        self.kind = kind
+        self.future = None
+        self._manager = manager
+        self._cancel = threading.Event()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def report(self, done=None, total=None, message=None):
+        """
+        Updates progress from inside the job. Also the cancellation point:
+        raises JobCancelled if a cancel was requested.
+        """
+        progress = {key: value for key, value in (('done', done), ('total', total), ('message', message))
+                    if value is not None}
+        if progress:
+            self._manager._execute("""
+                UPDATE background_jobs SET progress = progress || %s, heartbeat_at = NOW()
+                WHERE job_id = %s;
+            """, (Json(progress), self.id))
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+def job_dict(row):
+    (job_id, kind, description, status, cancel_requested, progress, result, error,
+     created_at, started_at, finished_at) = row
+    return {
+        'id': job_id,
+        'kind': kind,
+        'description': description,
+        'status': status,
+        'cancel_requested': cancel_requested,
+        'created_at': created_at.isoformat(),
+        'started_at': started_at.isoformat() if started_at else None,
+        'finished_at': finished_at.isoformat() if finished_at else None,
+        'progress': progress,
+        'result': result,
+        'error': error
+    }
+
+class JobManager:
+    """
+    Bounded job executor with its job table in Postgres. `connection` is a
+    callable returning a `with`-able connection (the app's pool). `max_workers`
+    jobs run at once per process, at most `max_pending` may be queued or
+    running across all processes, and the last `history` finished jobs stay
+    queryable. Active jobs not heartbeated for `stale_after` seconds are failed.
+    """
+
+    def __init__(self, connection, max_workers=1, max_pending=10, history=100, heartbeat=5.0, stale_after=60.0):
+        self.connection = connection
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.history = history
+        self.heartbeat = heartbeat
+        self.stale_after = stale_after
+        self._executor = None
+        self._local = {}  # job_id -> Job queued or running in this process
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_running(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Jobs and threads inherited across a fork do not run here
+            self._local = {}
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job')
+            threading.Thread(target=self._heartbeat_loop, name='job-heartbeat', daemon=True).start()
+            self._pid = os.getpid()
+
+    def _execute(self, query, params=(), fetch=False):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            rows = cursor.fetchall() if fetch else None
+            conn.commit()
+            cursor.close()
+        return rows
+
+    def _expire_stale(self, cursor):
+        cursor.execute("""
+            UPDATE background_jobs
+            SET status = 'failed', error = 'The server process running this job stopped', finished_at = NOW()
+            WHERE status IN %s AND heartbeat_at < NOW() - %s * INTERVAL '1 second';
+        """, (ACTIVE_STATUSES, self.stale_after))
+
+    def submit(self, kind, func, *args, owner=None, description='', dedupe=False, **kwargs):
+        """
+        Queues func(job, *args, **kwargs) and returns the new job's dict. With
+        dedupe, an already active job of the same kind is returned instead of
+        queuing a second one.
+        """
+        self._ensure_running()
+        job_id = uuid.uuid4().hex[:12]
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT pg_advisory_xact_lock(%s);", (JOBS_LOCK_ID,))
+            self._expire_stale(cursor)
+            cursor.execute("SELECT job_id, kind FROM background_jobs WHERE status IN %s ORDER BY created_at;",
+                           (ACTIVE_STATUSES,))
+            active = cursor.fetchall()
+            duplicate = next((active_id for active_id, active_kind in active if active_kind == kind), None)
+            if dedupe and duplicate:
+                conn.commit()
+                return self.get(duplicate)
+            if len(active) >= self.max_pending:
+                conn.commit()
+                raise JobQueueFull(f"{len(active)} jobs already queued or running")
+
+            cursor.execute("""
+                INSERT INTO background_jobs (job_id, kind, owner, description, runner)
+                VALUES (%s, %s, %s, %s, %s);
+            """, (job_id, kind, owner, description, f"{socket.gethostname()}:{os.getpid()}"))
+            # Drop the oldest finished jobs beyond the history limit
+            cursor.execute("""
+                DELETE FROM background_jobs WHERE job_id IN (
+                    SELECT job_id FROM background_jobs WHERE status NOT IN %s
+                    ORDER BY created_at DESC OFFSET %s
+                );
+            """, (ACTIVE_STATUSES, self.history))
+            conn.commit()
+            cursor.close()
+
+        job = Job(self, job_id, kind)
+        with self._lock:
+            self._local[job_id] = job
+            job.future = self._executor.submit(self._run, job, func, args, kwargs)
+        return self.get(job_id)
+
+    def get(self, job_id):
+        rows = self._execute(f"SELECT {JOB_COLUMNS} FROM background_jobs WHERE job_id = %s;", (job_id,), fetch=True)
+        return job_dict(rows[0]) if rows else None
+
+    def list(self):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            self._expire_stale(cursor)
+            cursor.execute(f"""
+                SELECT {JOB_COLUMNS} FROM background_jobs
+                ORDER BY created_at DESC LIMIT %s;
+            """, (self.history + self.max_pending,))
+            rows = cursor.fetchall()
+            conn.commit()
+            cursor.close()
+        return [job_dict(row) for row in rows]
+
+    def cancel(self, job_id):
+        """
+        Cancels a queued job immediately, or asks a running one to stop. A job
+        of another process sees the request on that process's next heartbeat.
+        """
+        self._execute("""
+            UPDATE background_jobs SET cancel_requested = TRUE
+            WHERE job_id = %s AND status IN %s;
+        """, (job_id, ACTIVE_STATUSES))
+        with self._lock:
+            job = self._local.get(job_id)
+        if job is not None:
+            self._cancel_local(job)
+        return self.get(job_id)
+
+    def _cancel_local(self, job):
+        job._cancel.set()
+        if job.future is not None and job.future.cancel():
+            self._finish(job, 'cancelled')
+
+    def _run(self, job, func, args, kwargs):
+        if job.cancel_requested:
+            self._finish(job, 'cancelled')
+            return
+
+        try:
+            self._execute("""
+                UPDATE background_jobs SET status = 'running', started_at = NOW(), heartbeat_at = NOW()
+                WHERE job_id = %s;
+            """, (job.id,))
+            result = func(job, *args, **kwargs)
+            self._finish(job, 'succeeded', result=result)
+        except JobCancelled:
+            self._finish(job, 'cancelled')
+        except Exception as e:
+            traceback.print_exc()
+            self._finish(job, 'failed', error=str(e))
+
+    def _finish(self, job, status, result=None, error=None):
+        with self._lock:
+            self._local.pop(job.id, None)
+        try:
+            self._execute("""
+                UPDATE background_jobs SET status = %s, result = %s, error = %s, finished_at = NOW()
+                WHERE job_id = %s;
+            """, (status, Json(result) if result is not None else None, error, job.id))
+        except Exception as e:
+            # The row stays active until its heartbeat is stale, then it is failed
+            print(f"Could not record the end of job {job.id}: {e}")
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(self.heartbeat)
+            with self._lock:
+                local = dict(self._local)
+            if not local:
+                continue
+            try:
+                rows = self._execute("""
+                    UPDATE background_jobs SET heartbeat_at = NOW()
+                    WHERE job_id = ANY(%s) RETURNING job_id, cancel_requested;
+                """, (list(local),), fetch=True)
+            except Exception as e:
+                print(f"Job heartbeat error: {e}")
+                continue
+            for job_id, cancel_requested in rows:
+                if cancel_requested and not local[job_id].cancel_requested:
+                    self._cancel_local(local[job_id])
@@ -0,0 +1,82 @@
+import json
+import hashlib
+from functools import wraps
+from flask import request, make_response
+
+# Conditional GET for the read APIs.
+#
+# Every data source has a row in ingest_watermark whose revision moves on each
+# change: the feeder advances 'swis_moments' per loaded file, and triggers
+# bump 'alerts' and 'cme_events' (see feeder.ensure_revision_triggers). Each
+# server process keeps an in-memory copy of those rows, reloaded by the app's
+# shared db.NotificationListener whenever a change is announced on one of
+# `channels`.
+#
+# A view wrapped in conditional() gets an ETag built from the revisions of
+# the sources it reads plus its query parameters, so a matching If-None-Match
+# is answered with 304 before the view (and its SQL) runs. While the listener
+# is disconnected nothing can be trusted: no ETag is sent and no 304 is given.
+# The listener only reads: the table and triggers are created by the feeder's
+# schema setup, and until they exist the views simply run unconditionally.
+
+class RevisionTracker:
+    """In-process copy of ingest_watermark: source -> (revision, updated_at)."""
+
+    def __init__(self, listener, channels):
+        self.listener = listener
+        self._revisions = None
+        listener.subscribe(channels, on_notify=lambda conn, notifies: self._reload(conn),
+                           on_connect=self._reload, on_disconnect=self._forget)
+
+    def snapshot(self):
+        """Current revisions, or None while they cannot be trusted."""
+        self.listener.ensure_running()
+        return self._revisions
+
+    def _reload(self, conn):
+        cursor = conn.cursor()
+        cursor.execute("SELECT source, revision, updated_at FROM ingest_watermark;")
+        self._revisions = {source: (revision, updated_at) for source, revision, updated_at in cursor.fetchall()}
+        cursor.close()
+
+    def _forget(self):
+        self._revisions = None
+
+    def conditional(self, *sources, key=None):
+        """
+        Decorator adding ETag / Last-Modified to a view that reads `sources`.
+        `key` is an optional callable returning anything else the response
+        depends on (e.g. the user's role). The Accept header is always part
+        of the tag, since it selects the response format.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                revisions = self.snapshot()
+                if revisions is None or any(source not in revisions for source in sources):
+                    return view(*args, **kwargs)
+
+                state = [
+                    request.path,
+                    sorted(request.args.items(multi=True)),
+                    request.headers.get('Accept', ''),
+                    key() if key else None,
+                    [revisions[source][0] for source in sources]
+                ]
+                etag = hashlib.sha1(json.dumps(state, default=str).encode()).hexdigest()
+                if request.if_none_match.contains_weak(etag):
+                    response = make_response('', 304)
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+
+                response.set_etag(etag, weak=True)
+                modified = [revisions[source][1] for source in sources if revisions[source][1]]
+                if modified:
+                    response.last_modified = max(modified)
+                # Let browsers keep the body but revalidate on every poll
+                response.headers['Cache-Control'] = 'no-cache'
+                return response
+            return wrapper
+        return decorator
@@ -0,0 +1,68 @@
+import time
+import threading
+from collections import OrderedDict
+
+# In-process cache for flask_login's user_loader, so authenticated requests
+# do not query users/roles every time.
+#
+# Entries expire after `ttl` seconds. Scripts that change users or roles
+# (reset_users.py, update_users_db.py) send NOTIFY on USERS_CHANNEL, and the
+# app's shared db.NotificationListener drops the cached users as soon as that
+# transaction commits. The payload is a user_id, or empty to mean everyone.
+
+USERS_CHANNEL = 'users_changed'
+
+class UserCache:
+    """Thread-safe TTL + LRU mapping of user_id -> User."""
+
+    def __init__(self, ttl=300.0, max_size=1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()  # user_id -> (expires_at, user)
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        key = str(user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, user_id, user):
+        key = str(user_id)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id=None):
+        """Drops one user, or every user when user_id is None."""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(user_id), None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+def watch_users(listener, cache):
+    """
+    Invalidates `cache` from USERS_CHANNEL through the shared
+    db.NotificationListener. The whole cache is dropped whenever the listener
+    (re)connects or starts in a new process, since notifications sent while it
+    was not listening are lost.
+    """
+    def on_notify(conn, notifies):
+        for notify in notifies:
+            cache.invalidate(notify.payload or None)
+
+    listener.subscribe((USERS_CHANNEL,), on_notify,
+                       on_connect=lambda conn: cache.invalidate(), on_disconnect=cache.invalidate)